@@ -1,7 +1,13 @@
-import xml.etree.ElementTree as ET
 import csv
-import sys
+import argparse
+import json
 import os
+import pickle
+import re
+import tempfile
+
+from run_stats import RunStats, add_stats_arguments
+from xml_records import extract_records
 
 # --- CONFIGURATION ---
 # The tag that starts a new record
@@ -9,6 +15,9 @@ START_TAG = '<us-patent-grant'
 # The tag that ends a record
 END_TAG = '</us-patent-grant>'
 
+# Schema cache file names are derived from the record's dtd-version attribute
+SCHEMA_FILE_SAFE = re.compile(r'[^A-Za-z0-9._-]+')
+
 def flatten_element(element, parent_key='', sep='.'):
     """Flattens the nested XML structure."""
     items = {}
@@ -26,84 +35,226 @@ def flatten_element(element, parent_key='', sep='.'):
         items.update(flatten_element(child, new_key, sep=sep))
     return items
 
-def parse_concatenated_xml(input_file, output_file):
+class FlatCsvWriter:
+    """
+    CSV writer for flattened records whose full set of columns is only known
+    once every record has been seen.
+
+    Rows are pickled to a temporary file as (column ids, values) while the
+    column set grows; close() writes the sorted header and replays them. When
+    a header is known up front (schema cache) rows go straight to the CSV, and
+    the first row with an unknown column moves everything written so far back
+    into the temporary store.
+
+    Either way the final header holds only the columns that some row actually
+    had, like the two-pass mode: cached columns no row used are dropped at
+    close(), by one pass over the CSV if it was written directly.
+    """
+
+    def __init__(self, output_file, known_header=None):
+        self.output_file = output_file
+        self.columns = {}
+        self.seen = set()
+        self._spill = None
+        self._out = None
+        self._writer = None
+        if known_header is not None:
+            for key in known_header:
+                self.columns.setdefault(key, len(self.columns))
+            self._out = open(output_file, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._out, fieldnames=sorted(self.columns))
+            self._writer.writeheader()
+        else:
+            self._spill = tempfile.TemporaryFile()
+
+    def writerow(self, row):
+        self.seen.update(row)
+        if self._writer is not None:
+            if all(key in self.columns for key in row):
+                self._writer.writerow(row)
+                return
+            self._spill_written_rows()
+        self._store(row)
+
+    def _store(self, row):
+        columns = self.columns
+        ids = tuple(columns.setdefault(key, len(columns)) for key in row)
+        self._spill.write(pickle.dumps((ids, tuple(row.values())), pickle.HIGHEST_PROTOCOL))
+
+    def _spill_written_rows(self):
+        """Cached header was incomplete: move rows already in the CSV into the store."""
+        self._out.close()
+        self._writer = None
+        self._spill = tempfile.TemporaryFile()
+        with open(self.output_file, newline='', encoding='utf-8') as f_in:
+            for row in csv.DictReader(f_in):
+                self._store(row)
+
+    def _drop_unseen_columns(self, header):
+        """Rewrite the directly written CSV with only the columns in header."""
+        tmp = self.output_file + ".tmp"
+        with open(self.output_file, newline='', encoding='utf-8') as f_in, \
+                open(tmp, 'w', newline='', encoding='utf-8') as f_out:
+            reader = csv.reader(f_in)
+            positions = {name: i for i, name in enumerate(next(reader))}
+            keep = [positions[name] for name in header]
+            writer = csv.writer(f_out)
+            writer.writerow(header)
+            for values in reader:
+                writer.writerow([values[i] for i in keep])
+        os.replace(tmp, self.output_file)
+
+    def close(self):
+        """Finish the CSV and return its header."""
+        header = sorted(self.seen)
+        if self._writer is not None:
+            self._out.close()
+            if len(header) < len(self.columns):
+                self._drop_unseen_columns(header)
+            return header
+
+        names = list(self.columns)
+        with self._spill, open(self.output_file, 'w', newline='', encoding='utf-8') as f_out:
+            # Rows moved back from a cached-header CSV carry every cached column
+            writer = csv.DictWriter(f_out, fieldnames=header, extrasaction='ignore')
+            writer.writeheader()
+            self._spill.seek(0)
+            while True:
+                try:
+                    ids, values = pickle.load(self._spill)
+                except EOFError:
+                    break
+                writer.writerow({names[i]: v for i, v in zip(ids, values)})
+        return header
+
+def _schema_path(schema_cache, dtd_version):
+    name = SCHEMA_FILE_SAFE.sub('_', dtd_version).strip('_') or 'unknown'
+    return os.path.join(schema_cache, f"schema_{name}.json")
+
+def load_cached_schema(schema_cache, dtd_version):
+    """Column list cached for this DTD version, or None."""
+    path = _schema_path(schema_cache, dtd_version)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_cached_schema(schema_cache, dtd_version, columns):
+    """Merge columns into the cached schema for this DTD version."""
+    os.makedirs(schema_cache, exist_ok=True)
+    known = set(load_cached_schema(schema_cache, dtd_version) or ())
+    if set(columns) <= known:
+        return
+    path = _schema_path(schema_cache, dtd_version)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(sorted(known | set(columns)), f)
+    os.replace(tmp, path)
+
+def parse_single_pass(input_file, output_file, schema_cache=None, stats_json=None):
+    """
+    Flatten every record exactly once. The header is discovered on the way
+    (rows wait in a temporary store), or taken from the schema cached for the
+    file's dtd-version, in which case rows are written straight to the CSV.
+    """
+    writer = None
+    seen_by_dtd = {}
+    count = 0
+
+    stats = RunStats(input_file)
+    for row_data in extract_records(input_file, START_TAG, END_TAG, flatten_element, stats=stats):
+        # flatten_element keeps the root's attributes as '@name'
+        dtd_version = row_data.get('@dtd-version', '')
+        if writer is None:
+            cached = load_cached_schema(schema_cache, dtd_version) if schema_cache else None
+            if cached is not None:
+                print(f"Using cached schema for DTD '{dtd_version}' ({len(cached)} columns).")
+            writer = FlatCsvWriter(output_file, cached)
+        writer.writerow(row_data)
+        if schema_cache:
+            seen_by_dtd.setdefault(dtd_version, set()).update(row_data)
+        count += 1
+
+    if writer is None:
+        writer = FlatCsvWriter(output_file)
+    header = writer.close()
+    for dtd_version, columns in seen_by_dtd.items():
+        save_cached_schema(schema_cache, dtd_version, columns)
+
+    stats.finish(stats_json)
+    print(f"Detected {len(header)} unique columns.")
+    print(f"Success! Converted {count} patents to {output_file}")
+
+def parse_concatenated_xml(input_file, output_file, single_pass=False, schema_cache=None,
+                           stats_json=None):
+    """
+    Two passes unless single_pass/schema_cache: one to collect the columns,
+    one to write the rows. The stats cover the whole run: records and
+    malformed counts come from the writing pass, phase times add up both.
+    """
     if not os.path.exists(input_file):
         print(f"Error: File {input_file} not found.")
         return
 
     print(f"Processing: {input_file}")
+
+    if single_pass or schema_cache:
+        print("Single pass: flattening each record once...")
+        parse_single_pass(input_file, output_file, schema_cache=schema_cache,
+                          stats_json=stats_json)
+        return
     
     # --- PHASE 1: SCAN FOR HEADERS ---
     print("Phase 1: Scanning file to detect all columns (this ensures no data is lost)...")
     all_headers = set()
     
-    # We read the file line by line as text
-    with open(input_file, 'r', encoding='utf-8') as f:
-        buffer = []
-        inside_record = False
-        count = 0
-        
-        for line in f:
-            if START_TAG in line:
-                inside_record = True
-                buffer = [line] # Start fresh buffer
-            elif inside_record:
-                buffer.append(line)
-                if END_TAG in line:
-                    inside_record = False
-                    # We have a full XML block in 'buffer'. Parse it.
-                    xml_string = "".join(buffer)
-                    try:
-                        root = ET.fromstring(xml_string)
-                        flat = flatten_element(root)
-                        all_headers.update(flat.keys())
-                        count += 1
-                        if count % 500 == 0:
-                            print(f"Scanned {count} patents...", end='\r')
-                    except ET.ParseError:
-                        pass # Skip broken blocks
-
-    print(f"\nPhase 1 Complete. Detected {len(all_headers)} unique columns.")
+    # Records are split straight out of the memory-mapped file as bytes;
+    # broken blocks are skipped and counted
+    scan = RunStats(input_file)
+    for flat in extract_records(input_file, START_TAG, END_TAG, flatten_element, stats=scan):
+        all_headers.update(flat.keys())
+    scan.finish()
+
+    print(f"Phase 1 Complete. Detected {len(all_headers)} unique columns.")
     
     # Sort headers
     csv_headers = sorted(list(all_headers))
 
     # --- PHASE 2: WRITE DATA ---
     print("Phase 2: Writing data to CSV...")
-    
-    with open(input_file, 'r', encoding='utf-8') as f_in, \
-         open(output_file, 'w', newline='', encoding='utf-8') as f_out:
-        
+
+    stats = RunStats(input_file)
+    stats.started = scan.started
+    stats.add({phase: scan.counts[phase] for phase in ('split', 'parse', 'extract', 'write')})
+    with open(output_file, 'w', newline='', encoding='utf-8') as f_out:
         writer = csv.DictWriter(f_out, fieldnames=csv_headers)
         writer.writeheader()
-        
-        buffer = []
-        inside_record = False
+
         count = 0
-        
-        for line in f_in:
-            if START_TAG in line:
-                inside_record = True
-                buffer = [line]
-            elif inside_record:
-                buffer.append(line)
-                if END_TAG in line:
-                    inside_record = False
-                    xml_string = "".join(buffer)
-                    try:
-                        root = ET.fromstring(xml_string)
-                        row_data = flatten_element(root)
-                        writer.writerow(row_data)
-                        count += 1
-                        if count % 100 == 0:
-                            print(f"Written {count} rows...", end='\r')
-                    except ET.ParseError:
-                        print(f"Skipping a malformed record at index {count}")
-
-    print(f"\nSuccess! Converted {count} patents to {output_file}")
+
+        for row_data in extract_records(input_file, START_TAG, END_TAG, flatten_element,
+                                        stats=stats):
+            writer.writerow(row_data)
+            count += 1
+
+    stats.finish(stats_json)
+    print(f"Success! Converted {count} patents to {output_file}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Flatten concatenated USPTO grant XML into one wide CSV.")
+    ap.add_argument("input_file", help="Concatenated USPTO XML (.xml, or .zip/.gz/.xz read without unpacking).")
+    ap.add_argument("output_file")
+    ap.add_argument("--single-pass", action="store_true",
+                    help="Parse the file once, spilling rows to a temp file until the header is known.")
+    ap.add_argument("--schema-cache", metavar="DIR",
+                    help="Cache discovered columns per dtd-version in DIR; a cached schema skips "
+                         "discovery on later files (implies --single-pass).")
+    add_stats_arguments(ap)
+    args = ap.parse_args()
+
+    parse_concatenated_xml(args.input_file, args.output_file,
+                           single_pass=args.single_pass, schema_cache=args.schema_cache,
+                           stats_json=args.stats_json)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python3 Parse_xml.py <input_file> <output_file>")
-    else:
-        parse_concatenated_xml(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    main()
@@ -0,0 +1,168 @@
+"""
+End-to-end benchmark of the XML extractors on a synthetic corpus.
+
+Generates grant and application files with synth_xml.py (or reuses them
+from --corpus-dir), runs each extractor as its own process, as the weekly
+job does, and reports wall time, records/sec and peak memory (max RSS of
+the largest process in the run, worker processes included).
+
+--save writes the results as JSON; --baseline compares against an earlier
+--save and exits with status 1 if a benchmark got slower than --tolerance.
+
+Usage:
+python3 benchmark.py --records 20000 --save bench.json
+python3 benchmark.py --records 20000 --baseline bench.json --only applications citations
+python3 benchmark.py --workers 4 --backend lxml --repeat 3
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synth_xml import add_corpus_arguments, write_corpus
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (corpus kind, argv after the interpreter; {input}/{out} are filled in,
+#          whether the script takes --workers/--backend)
+BENCHMARKS = {
+    'applications': ('application', ['parser.py', '{input}', '{out}.csv'], True),
+    'citations': ('grant', ['export_xml.py', '{input}', '{out}.csv'], True),
+    'citation-edges': ('grant', ['export_xml.py', '{input}', '{out}', '--edges'], True),
+    'flatten': ('grant', ['Parse_xml.py', '{input}', '{out}.csv'], False),
+    'flatten-single-pass': ('grant', ['Parse_xml.py', '{input}', '{out}.csv', '--single-pass'], False),
+    'extract-all': ('grant', ['extract_all.py', '{input}', '--citations', '{out}.cit.csv',
+                              '--flatten', '{out}.flat.csv'], True),
+}
+
+
+def run_one(argv, log_path):
+    """Run argv to completion; returns (seconds, peak RSS in MB). Raises on failure."""
+    with open(log_path, 'w', encoding='utf-8') as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=HERE, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        with open(log_path, encoding='utf-8', errors='replace') as log:
+            tail = log.read()[-2000:]
+        raise RuntimeError(f"{' '.join(argv)} exited with {proc.returncode}:\n{tail}")
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return seconds, usage.ru_maxrss * scale / 1e6
+
+
+CORPUS_OPTIONS = ('records', 'claims', 'citations', 'npl_fraction', 'paragraphs', 'words',
+                  'malformed', 'seed')
+
+
+def make_corpus(corpus_dir, kind, args):
+    """Generate (once per set of corpus options) the input file for `kind`."""
+    options = repr([getattr(args, k) for k in CORPUS_OPTIONS]).encode()
+    tag = hashlib.blake2b(options, digest_size=4).hexdigest()
+    path = os.path.join(corpus_dir, f"synth_{kind}_{args.records}_{tag}.xml")
+    if not os.path.exists(path):
+        print(f"Generating {args.records} {kind} records -> {path}")
+        write_corpus(path, kind=kind, records=args.records, claims=args.claims,
+                     citations=args.citations, npl_fraction=args.npl_fraction,
+                     paragraphs=args.paragraphs, words=args.words,
+                     malformed=args.malformed, seed=args.seed)
+    return path
+
+
+def run_benchmarks(names, args, corpus_dir, work_dir):
+    results = {}
+    for name in names:
+        kind, template, parallel = BENCHMARKS[name]
+        input_file = make_corpus(corpus_dir, kind, args)
+        out = os.path.join(work_dir, name)
+        argv = [sys.executable] + [a.format(input=input_file, out=out) for a in template]
+        if parallel:
+            argv += ['--workers', str(args.workers), '--backend', args.backend]
+
+        times, peaks = [], []
+        for _ in range(args.repeat):
+            seconds, peak = run_one(argv, out + '.log')
+            times.append(seconds)
+            peaks.append(peak)
+        best = min(times)
+        results[name] = {
+            'records': args.records,
+            'input_mb': round(os.path.getsize(input_file) / 1e6, 1),
+            'seconds': round(best, 3),
+            'records_per_second': round(args.records / best, 1),
+            'mb_per_second': round(os.path.getsize(input_file) / 1e6 / best, 2),
+            'peak_rss_mb': round(max(peaks), 1),
+            'workers': args.workers if parallel else 1,
+        }
+        r = results[name]
+        print(f"{name:<20} {r['seconds']:>8.2f}s {r['records_per_second']:>10,.0f} rec/s "
+              f"{r['mb_per_second']:>7.1f} MB/s {r['peak_rss_mb']:>8.1f} MB peak")
+    return results
+
+
+def compare(results, baseline_file, tolerance):
+    """Print the change against a saved run; returns the names that regressed."""
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressed = []
+    print(f"\nAgainst {baseline_file}:")
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old is None or (old['records'], old['workers']) != (r['records'], r['workers']):
+            print(f"{name:<20} no comparable baseline")
+            continue
+        ratio = r['seconds'] / old['seconds']
+        mem = r['peak_rss_mb'] / old['peak_rss_mb'] if old['peak_rss_mb'] else 1.0
+        flag = "  SLOWER" if ratio > 1 + tolerance else ""
+        print(f"{name:<20} time x{ratio:.2f}  memory x{mem:.2f}{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the USPTO XML extractors on synthetic data.")
+    ap.add_argument("--only", nargs="+", choices=BENCHMARKS, metavar="NAME",
+                    help="Benchmarks to run (default: all): " + ", ".join(BENCHMARKS))
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--backend", choices=("auto", "lxml", "etree"), default="auto")
+    ap.add_argument("--repeat", type=int, default=1, help="Runs per benchmark; the fastest counts.")
+    ap.add_argument("--corpus-dir", help="Keep/reuse generated corpora here (default: temporary).")
+    ap.add_argument("--save", metavar="FILE", help="Write the results as JSON.")
+    ap.add_argument("--baseline", metavar="FILE", help="Compare against a previous --save.")
+    ap.add_argument("--tolerance", type=float, default=0.10,
+                    help="Allowed slowdown against --baseline before failing (default: 0.10).")
+    add_corpus_arguments(ap)
+    args = ap.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="xml_bench_")
+    corpus_dir = args.corpus_dir or work_dir
+    os.makedirs(corpus_dir, exist_ok=True)
+    try:
+        results = run_benchmarks(args.only or list(BENCHMARKS), args, corpus_dir, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'corpus': {k: getattr(args, k) for k in CORPUS_OPTIONS},
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f"Saved results to {args.save}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Build and run the C multi-file merger (Merger.c) from Python.
+
+The binary is compiled from the repository source the first time it is
+needed and kept in a build cache directory under a name that includes a
+hash of the source, the compiler and the flags, so editing Merger.c (or
+switching compilers) rebuilds it and an unchanged source is never compiled
+twice. The compiler is $CC, else the first of cc, gcc and clang on PATH.
+
+merger.py --inputs ... --backend c uses this; when no compiler is found or
+the build fails it falls back to the pandas implementation.
+
+Usage (maintenance):
+python3 c_merger.py build
+python3 c_merger.py clear --build-dir /scratch/patent-build
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, 'Merger.c')
+BUILD_DIR = os.environ.get('PATENT_BUILD_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'patent-build'))
+COMPILERS = ('cc', 'gcc', 'clang')
+CFLAGS = ['-O2']
+
+# Merger.c's closing line on stderr
+SUMMARY_RE = re.compile(r'Eligible IDs: (\d+)\. Wrote (\d+) rows')
+
+
+class BuildError(RuntimeError):
+    pass
+
+
+def find_compiler():
+    """$CC, else the first C compiler on PATH; None if there is none."""
+    cc = os.environ.get('CC')
+    if cc:
+        return shutil.which(cc)
+    for name in COMPILERS:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def binary_path(source=SOURCE, compiler=None, build_dir=BUILD_DIR):
+    """<build_dir>/<source stem>-<hash of source, compiler and flags>"""
+    with open(source, 'rb') as f:
+        digest = hashlib.blake2b(f.read(), digest_size=8)
+    digest.update(repr((compiler, CFLAGS)).encode())
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(build_dir, f"{stem}-{digest.hexdigest()}")
+
+
+def build(source=SOURCE, build_dir=BUILD_DIR):
+    """
+    Path of the compiled `source`, compiling it first if the cache has no
+    binary for this source. Returns None if there is no compiler; raises
+    BuildError if compiling fails.
+    """
+    compiler = find_compiler()
+    if compiler is None:
+        return None
+    target = binary_path(source, compiler, build_dir)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(build_dir, exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    proc = subprocess.run([compiler, *CFLAGS, '-o', tmp, source],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if proc.returncode != 0:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise BuildError(f"{os.path.basename(compiler)} failed on {source}:\n{proc.stdout[-2000:]}")
+    os.replace(tmp, target)
+    print(f"Built {target}")
+    return target
+
+
+def merge_many(binary, paths, output_file, sample):
+    """
+    Run the compiled Merger.c on `paths`. Returns (eligible, written) like
+    merger.merge_many.
+    """
+    proc = subprocess.run([binary, '-n', str(sample), '-o', output_file, *paths],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    sys.stdout.write(proc.stdout)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(binary)} exited with {proc.returncode}")
+    m = SUMMARY_RE.search(proc.stdout)
+    # No summary line: no eligible IDs, and Merger.c writes no file at all
+    return (int(m.group(1)), int(m.group(2))) if m else (0, 0)
+
+
+def clear(build_dir=BUILD_DIR):
+    if not os.path.isdir(build_dir):
+        return
+    for name in os.listdir(build_dir):
+        os.remove(os.path.join(build_dir, name))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the C merger or empty its build cache.")
+    ap.add_argument("command", choices=("build", "clear"))
+    ap.add_argument("--build-dir", default=BUILD_DIR,
+                    help=f"Build cache directory (default: {BUILD_DIR}, or $PATENT_BUILD_CACHE).")
+    args = ap.parse_args()
+
+    if args.command == "clear":
+        clear(args.build_dir)
+        print(f"Cleared {args.build_dir}")
+        return
+    try:
+        binary = build(build_dir=args.build_dir)
+    except BuildError as e:
+        sys.exit(str(e))
+    if binary is None:
+        sys.exit("No C compiler found (set $CC or install cc/gcc/clang).")
+    print(binary)
+
+
+if __name__ == "__main__":
+    main()
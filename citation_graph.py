@@ -0,0 +1,217 @@
+"""
+Integer-encoded citation graph built from USPTO grant XML.
+
+export_xml.py --edges writes, for an output prefix P:
+- P.nodes      node dictionary, one key per line; line i (0-based) is node i.
+               Keys are COUNTRY-NUMBER with kind codes and leading zeros
+               dropped (US-7017193), so a grant and its citations meet.
+- P.edges      int32 (citing, cited) pairs, appended record by record
+- P.csr.npz    adjacency in both directions (compressed sparse rows):
+               cites[out_indptr[i]:out_indptr[i+1]]   = nodes i cites
+               cited_by[in_indptr[i]:in_indptr[i+1]]  = nodes citing i
+
+Queries:
+python3 citation_graph.py degree cites 7017193 US-10000000-B2
+python3 citation_graph.py degree cites --top 20
+python3 citation_graph.py neighbors cites 7017193 --direction cited-by
+python3 citation_graph.py index cites        # rebuild P.csr.npz from P.edges
+"""
+import argparse
+import os
+import sys
+from array import array
+
+import numpy as np
+
+from record_filter import id_key
+
+EDGE_DTYPE = np.int32
+
+# Edges buffered before each append to P.edges
+EDGE_BUFFER = 1 << 20
+
+
+def node_key(country, doc_number):
+    """('US', '07017193') -> 'US-7017193'."""
+    return f"{(country or 'US').strip().upper()}-{id_key(doc_number)}"
+
+
+def parse_node_key(text):
+    """User input -> node key: '7017193', 'US-7017193' and 'US-7017193-B2' all work."""
+    parts = text.strip().split('-')
+    if len(parts) == 1:
+        return node_key('US', parts[0])
+    return node_key(parts[0], parts[1])
+
+
+def _paths(prefix):
+    return prefix + '.nodes', prefix + '.edges', prefix + '.csr.npz'
+
+
+def read_nodes(prefix):
+    with open(prefix + '.nodes', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+class EdgeWriter:
+    """
+    Interns node keys to consecutive ints and appends (citing, cited) pairs
+    to P.edges. With append=True an existing dictionary and edge list are
+    extended (e.g. one weekly file after another), otherwise they are replaced.
+    close() writes the dictionary and rebuilds the CSR index.
+    """
+
+    def __init__(self, prefix, append=False):
+        self.prefix = prefix
+        nodes_path, edges_path, _ = _paths(prefix)
+        self.nodes = read_nodes(prefix) if append and os.path.exists(nodes_path) else []
+        self.ids = {key: i for i, key in enumerate(self.nodes)}
+        self.edge_count = os.path.getsize(edges_path) // 8 if append and os.path.exists(edges_path) else 0
+        self._f = open(edges_path, 'ab' if append else 'wb')
+        self._buffer = array('i')
+
+    def intern(self, key):
+        node = self.ids.get(key)
+        if node is None:
+            node = self.ids[key] = len(self.nodes)
+            self.nodes.append(key)
+        return node
+
+    def add(self, citing_key, cited_keys):
+        citing = self.intern(citing_key)
+        for key in cited_keys:
+            self._buffer.append(citing)
+            self._buffer.append(self.intern(key))
+        self.edge_count += len(cited_keys)
+        if len(self._buffer) >= 2 * EDGE_BUFFER:
+            self.flush()
+
+    def flush(self):
+        self._buffer.tofile(self._f)
+        self._buffer = array('i')
+
+    def close(self):
+        self.flush()
+        self._f.close()
+        with open(self.prefix + '.nodes', 'w', encoding='utf-8') as f:
+            for key in self.nodes:
+                f.write(key)
+                f.write('\n')
+        build_index(self.prefix)
+
+
+def _csr(src, dst, num_nodes):
+    """(indptr, indices) grouping dst by src; a stable sort keeps file order per node."""
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return indptr, dst[order]
+
+
+def build_index(prefix):
+    """Build P.csr.npz (both directions) from P.edges and P.nodes."""
+    nodes_path, edges_path, csr_path = _paths(prefix)
+    num_nodes = len(read_nodes(prefix))
+    edges = np.fromfile(edges_path, dtype=EDGE_DTYPE).reshape(-1, 2)
+    citing, cited = edges[:, 0], edges[:, 1]
+    out_indptr, out_indices = _csr(citing, cited, num_nodes)
+    in_indptr, in_indices = _csr(cited, citing, num_nodes)
+    np.savez(csr_path, out_indptr=out_indptr, out_indices=out_indices,
+             in_indptr=in_indptr, in_indices=in_indices)
+    return num_nodes, len(edges)
+
+
+class CitationGraph:
+    """Read-only view of P.nodes + P.csr.npz."""
+
+    def __init__(self, prefix):
+        self.nodes = read_nodes(prefix)
+        with np.load(prefix + '.csr.npz') as csr:
+            self.out_indptr = csr['out_indptr']
+            self.out_indices = csr['out_indices']
+            self.in_indptr = csr['in_indptr']
+            self.in_indices = csr['in_indices']
+        self._ids = None
+
+    def node_id(self, key):
+        """Node int for a key, or None. The reverse map is built on first use."""
+        if self._ids is None:
+            self._ids = {k: i for i, k in enumerate(self.nodes)}
+        return self._ids.get(parse_node_key(key))
+
+    def out_degree(self):
+        """Citations made, per node."""
+        return np.diff(self.out_indptr)
+
+    def in_degree(self):
+        """Times cited, per node."""
+        return np.diff(self.in_indptr)
+
+    def cites(self, node):
+        return self.out_indices[self.out_indptr[node]:self.out_indptr[node + 1]]
+
+    def cited_by(self, node):
+        return self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+
+def _degree(args):
+    graph = CitationGraph(args.prefix)
+    in_degree, out_degree = graph.in_degree(), graph.out_degree()
+    if args.ids:
+        nodes = []
+        for key in args.ids:
+            node = graph.node_id(key)
+            if node is None:
+                print(f"{key}: not in graph", file=sys.stderr)
+            else:
+                nodes.append(node)
+    else:
+        top = min(args.top, len(in_degree))
+        nodes = np.argsort(-in_degree, kind='stable')[:top]
+    print("node,cited_by,cites")
+    for node in nodes:
+        print(f"{graph.nodes[node]},{in_degree[node]},{out_degree[node]}")
+
+
+def _neighbors(args):
+    graph = CitationGraph(args.prefix)
+    node = graph.node_id(args.id)
+    if node is None:
+        sys.exit(f"Error: {args.id} not in graph.")
+    if args.direction in ("cites", "both"):
+        for other in graph.cites(node):
+            print(f"cites,{graph.nodes[other]}")
+    if args.direction in ("cited-by", "both"):
+        for other in graph.cited_by(node):
+            print(f"cited-by,{graph.nodes[other]}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the citation graph written by export_xml.py --edges.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ix = sub.add_parser("index", help="Rebuild PREFIX.csr.npz from PREFIX.edges.")
+    ix.add_argument("prefix")
+
+    dg = sub.add_parser("degree", help="Times cited / citations made, for IDs or the most cited.")
+    dg.add_argument("prefix")
+    dg.add_argument("ids", nargs="*", help="Patent numbers (US-7017193-B2, US-7017193 or 7017193).")
+    dg.add_argument("--top", type=int, default=10, help="Without IDs, show the N most cited (default: 10).")
+
+    nb = sub.add_parser("neighbors", help="Patents cited by / citing one patent.")
+    nb.add_argument("prefix")
+    nb.add_argument("id")
+    nb.add_argument("--direction", choices=("cites", "cited-by", "both"), default="both")
+    args = ap.parse_args()
+
+    if args.command == "index":
+        num_nodes, num_edges = build_index(args.prefix)
+        print(f"Indexed {num_edges} edges over {num_nodes} nodes.")
+    elif args.command == "degree":
+        _degree(args)
+    else:
+        _neighbors(args)
+
+
+if __name__ == "__main__":
+    main()
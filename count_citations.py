@@ -1,44 +1,412 @@
+import argparse
+import os
+import shutil
+import tempfile
+from collections import deque
+from contextlib import nullcontext
+from multiprocessing import Pool
+
+import numpy as np
 import pandas as pd
-import sys
+
+from hll import MAX_PRECISION, MIN_PRECISION, PRECISION, HLLSketches, hash_values, standard_error
+from input_cache import add_cache_arguments, cache_from_args
 
 # Usage: python count_citations.py input.tsv output.tsv
-inp = sys.argv[1]
-out = sys.argv[2] if len(sys.argv) > 2 else "citation_counts.tsv"
-
-# Read TSV; keep as strings to preserve any leading zeros
-df = pd.read_csv(inp, sep="\t", dtype=str)
-
-# Adjust these names if yours differ:
-# Expect columns like: patent_id, citation_patent_id (or cited_patent_id)
-if "citation_patent_id" not in df.columns and "cited_patent_id" in df.columns:
-    df = df.rename(columns={"cited_patent_id": "citation_patent_id"})
-
-required = {"patent_id", "citation_patent_id"}
-missing = required - set(df.columns)
-if missing:
-    raise SystemExit(f"Missing required columns: {missing}. Found: {list(df.columns)}")
-
-# Clean whitespace & drop rows with no citation
-df["patent_id"] = df["patent_id"].astype(str).str.strip()
-df["citation_patent_id"] = df["citation_patent_id"].astype(str).str.strip()
-df = df[df["citation_patent_id"] != ""]
-
-# Compute counts (total & unique)
-grp = df.groupby("patent_id", dropna=False)
-out_df = grp.agg(
-citation_total=("citation_patent_id", "size"),
-citation_unique=("citation_patent_id", pd.Series.nunique),
-).reset_index()
-
-# Write TSV
-out_df.to_csv(out, sep="\t", index=False)
-
-# Optional: print a quick check for 10000000 if present
-row = out_df.loc[out_df["patent_id"] == "10000000"]
-if not row.empty:
-    tot = int(row["citation_total"].iloc[0])
-uniq = int(row["citation_unique"].iloc[0])
-print(f"patent_id 10000000 → {tot} citations ({uniq} unique)")
-else:
-    print("patent_id 10000000 not found.")
-    print(f"Wrote: {out}")
\ No newline at end of file
+#        python count_citations.py g_us_patent_citation.tsv output.tsv --streaming --workers 4
+#        python count_citations.py g_us_patent_citation.tsv output.tsv --approx --precision 12
+#        python count_citations.py g_us_patent_citation.tsv output.tsv --forward --by-year citation_date
+# With --cache the parsed TSV is kept as Parquet (input_cache.py), so
+# re-running on the same file skips the text parsing.
+#
+# --streaming never holds the whole table: the TSV is read in chunks, each
+# (patent_id, citation_patent_id) pair goes to one of --shards files on disk
+# by a hash of its patent_id, and every shard (all the pairs of its patents)
+# is then counted on its own, --workers at a time. Counts are exact and the
+# output is the same as without --streaming.
+#
+# --approx streams the TSV once and keeps a HyperLogLog sketch (hll.py) of
+# each patent's citations instead of the pairs: a short sparse list for the
+# usual patent, 2**--precision bytes at most however many it cites.
+# citation_total stays exact, citation_unique is an estimate. Chunks are
+# sketched --workers at a time and the sketches merged. The patents in a
+# --check-fraction hash sample are also counted exactly, and the estimates'
+# error on them is printed.
+#
+# --forward adds "cited by" counts: both ID columns are integer-encoded with
+# one shared factorization and all four counts come from np.bincount over
+# the codes (unique counts over the de-duplicated pairs). The output then has
+# a row for every patent on either side, with cited_by_total and
+# cited_by_unique after the usual columns. --by-year COLUMN also writes
+# per-year totals (year = first four characters of COLUMN, e.g.
+# citation_date) to OUTPUT.by_year.tsv. A missing patent_id adds to
+# cited_by_total but not to cited_by_unique. --check recounts the forward
+# columns with a plain groupby/nunique and stops on any difference.
+
+COLUMNS = ["patent_id", "citation_patent_id"]
+CHUNK_ROWS = 2_000_000
+SHARDS = 64
+# Missing values in the shard files (an empty field is a valid, stripped ID)
+SHARD_NA = "\\N"
+CHECK_FRACTION = 0.01
+
+
+def _citation_column(columns):
+    # Adjust these names if yours differ:
+    # Expect columns like: patent_id, citation_patent_id (or cited_patent_id)
+    if "citation_patent_id" not in columns and "cited_patent_id" in columns:
+        return "cited_patent_id"
+    return "citation_patent_id"
+
+
+def _check_columns(columns):
+    missing = set(COLUMNS) - set(columns)
+    if missing:
+        raise SystemExit(f"Missing required columns: {missing}. Found: {list(columns)}")
+
+
+def read_citations(inp, cache=None):
+    # Read TSV; keep as strings to preserve any leading zeros
+    options = dict(sep="\t", dtype=str)
+    df = cache.read_csv(inp, **options) if cache else pd.read_csv(inp, **options)
+
+    cited = _citation_column(df.columns)
+    if cited != "citation_patent_id":
+        df = df.rename(columns={cited: "citation_patent_id"})
+    _check_columns(df.columns)
+    return df
+
+
+def iter_citations(inp, chunk_rows=CHUNK_ROWS, cache=None):
+    """The two ID columns of the TSV in chunks, cleaned as in count_citations."""
+    header = pd.read_csv(inp, sep="\t", nrows=0).columns
+    cited = _citation_column(header)
+    usecols = ["patent_id", cited]
+    _check_columns(["citation_patent_id" if c == cited else c for c in header])
+
+    # Same read options as read_citations, so a cached full read is reused
+    options = dict(sep="\t", dtype=str)
+    if cache:
+        chunks = cache.iter_csv(inp, chunk_rows, columns=usecols, **options)
+    else:
+        chunks = pd.read_csv(inp, chunksize=chunk_rows, usecols=usecols, **options)
+    for chunk in chunks:
+        yield clean_citations(chunk.rename(columns={cited: "citation_patent_id"})[COLUMNS])
+
+
+def clean_citations(df):
+    # Clean whitespace & drop rows with no citation
+    df = df.copy()
+    df["patent_id"] = df["patent_id"].astype(str).str.strip()
+    df["citation_patent_id"] = df["citation_patent_id"].astype(str).str.strip()
+    return df[df["citation_patent_id"] != ""]
+
+
+def count_clean(df):
+    # Compute counts (total & unique). A missing citation counts towards the
+    # total but not the unique count, as with nunique; de-duplicating the
+    # pairs once is much cheaper than nunique per group.
+    total = df.groupby("patent_id", dropna=False).size()
+    cited = df.dropna(subset=["citation_patent_id"]).drop_duplicates(COLUMNS)
+    unique = cited.groupby("patent_id", dropna=False).size()
+    return pd.DataFrame({
+        "patent_id": total.index,
+        "citation_total": total.to_numpy(),
+        "citation_unique": unique.reindex(total.index, fill_value=0).to_numpy(),
+    })
+
+
+def count_citations(df):
+    return count_clean(clean_citations(df[COLUMNS]))
+
+
+def read_id_columns(inp, extra=(), cache=None):
+    """Just the two ID columns (plus `extra`), cleaned as in count_citations."""
+    header = pd.read_csv(inp, sep="\t", nrows=0).columns
+    cited = _citation_column(header)
+    _check_columns(["citation_patent_id" if c == cited else c for c in header])
+    missing = set(extra) - set(header)
+    if missing:
+        raise SystemExit(f"Missing columns: {missing}. Found: {list(header)}")
+    options = dict(sep="\t", dtype=str, usecols=["patent_id", cited, *extra])
+    df = cache.read_csv(inp, **options) if cache else pd.read_csv(inp, **options)
+    df = df.rename(columns={cited: "citation_patent_id"})
+    return clean_citations(df[COLUMNS + list(extra)])
+
+
+def _encode(df):
+    """Shared integer codes for both ID columns: (citing, cited, ids); missing cited is -1."""
+    n = len(df)
+    both = pd.concat([df["patent_id"], df["citation_patent_id"]], ignore_index=True)
+    # Unsorted (hash) factorization; the results are sorted instead, which
+    # is cheaper than sorting every ID occurrence
+    codes, ids = pd.factorize(both)
+    citing, cited = codes[:n], codes[n:]
+    if (citing < 0).any():
+        # A missing patent_id is its own group, as with groupby(dropna=False)
+        citing = np.where(citing < 0, len(ids), citing)
+        ids = ids.append(pd.Index([np.nan], dtype=ids.dtype))
+    return citing, cited, ids
+
+
+def count_both(df, encoded=None):
+    """Backward and forward totals and unique counts per patent, with np.bincount."""
+    citing, cited, ids = encoded or _encode(df)
+    k = len(ids)
+    has_cited = cited >= 0
+    pairs = pd.unique(citing[has_cited].astype(np.int64) * k + cited[has_cited])
+    # A missing patent_id adds to cited_by_total, but is not a distinct citer
+    known_citer = pairs // k != k - 1 if ids.hasnans else slice(None)
+
+    counts = pd.DataFrame({
+        "patent_id": ids,
+        "citation_total": np.bincount(citing, minlength=k),
+        "citation_unique": np.bincount(pairs // k, minlength=k),
+        "cited_by_total": np.bincount(cited[has_cited], minlength=k),
+        "cited_by_unique": np.bincount(pairs[known_citer] % k, minlength=k),
+    })
+    counts = counts[(counts["citation_total"] > 0) | (counts["cited_by_total"] > 0)]
+    return counts.sort_values("patent_id", ignore_index=True)
+
+
+def check_forward(df, counts):
+    """Exit if the forward counts differ from a plain groupby over the cited column."""
+    by_cited = df.dropna(subset=["citation_patent_id"]).groupby("citation_patent_id")
+    expected = pd.DataFrame({
+        "cited_by_total": by_cited.size(),
+        "cited_by_unique": by_cited["patent_id"].nunique(),
+    })
+    got = counts.set_index("patent_id")[["cited_by_total", "cited_by_unique"]]
+    got = got[got["cited_by_total"] > 0]
+    differ = (got.reindex(expected.index) != expected).any(axis=1)
+    if len(got) != len(expected) or differ.any():
+        raise SystemExit(f"Forward counts differ from groupby for {max(differ.sum(), 1)} patents, "
+                         f"e.g. {list(expected.index[differ][:5])}")
+    print(f"Checked forward counts of {len(expected)} patents against groupby.")
+
+
+def count_by_year(df, year_column, encoded=None):
+    """Long table of backward and forward totals per patent and year."""
+    citing, cited, ids = encoded or _encode(df)
+    # Few distinct prefixes: parse those, not every row
+    prefix_codes, prefixes = pd.factorize(df[year_column].str[:4])
+    year = pd.to_numeric(pd.Series(prefixes), errors="coerce").to_numpy(np.float64)[prefix_codes]
+    year[prefix_codes < 0] = np.nan
+    dated = ~np.isnan(year)
+    year_codes, years = pd.factorize(year[dated].astype(np.int64), sort=True)
+    y = len(years)
+    if y == 0:
+        return pd.DataFrame(columns=["patent_id", "year", "citation_total", "cited_by_total"])
+
+    # Sparse (patent, year) keys: patents x years is too large to bincount densely
+    backward_keys, backward = np.unique(citing[dated].astype(np.int64) * y + year_codes,
+                                        return_counts=True)
+    forward_rows = cited[dated] >= 0
+    forward_keys, forward = np.unique(cited[dated][forward_rows].astype(np.int64) * y
+                                      + year_codes[forward_rows], return_counts=True)
+    keys = np.sort(np.concatenate([backward_keys, forward_keys]))
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    totals = np.zeros((2, len(keys)), dtype=np.int64)
+    totals[0, np.searchsorted(keys, backward_keys)] = backward
+    totals[1, np.searchsorted(keys, forward_keys)] = forward
+
+    # Order by patent_id, then year, on integers: each code's rank among the sorted IDs
+    rank = np.empty(len(ids), dtype=np.int64)
+    rank[ids.argsort()] = np.arange(len(ids))
+    order = np.argsort(rank[keys // y] * y + keys % y, kind="stable")
+    keys, totals = keys[order], totals[:, order]
+    return pd.DataFrame({
+        "patent_id": ids[keys // y],
+        "year": years[keys % y],
+        "citation_total": totals[0],
+        "cited_by_total": totals[1],
+    })
+
+
+def write_shards(chunks, shard_dir, shards=SHARDS):
+    """Append every chunk's rows to shard_dir/shard_NNNN.tsv by a hash of patent_id."""
+    paths = [os.path.join(shard_dir, f"shard_{i:04d}.tsv") for i in range(shards)]
+    files = [open(p, "w", encoding="utf-8", newline="") for p in paths]
+    try:
+        for chunk in chunks:
+            shard = pd.util.hash_pandas_object(chunk["patent_id"], index=False).to_numpy() % shards
+            for i, part in chunk.groupby(shard, sort=False):
+                part.to_csv(files[i], sep="\t", header=False, index=False, na_rep=SHARD_NA)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def count_shard(path):
+    df = pd.read_csv(path, sep="\t", header=None, names=COLUMNS, dtype=str,
+                     keep_default_na=False, na_values=[SHARD_NA])
+    return count_clean(df)
+
+
+def count_citations_streaming(inp, chunk_rows=CHUNK_ROWS, shards=SHARDS, workers=1,
+                              tmp_dir=None, cache=None):
+    shard_dir = tempfile.mkdtemp(prefix="citation_shards_", dir=tmp_dir)
+    try:
+        paths = write_shards(iter_citations(inp, chunk_rows, cache), shard_dir, shards)
+        if workers > 1:
+            with Pool(workers) as pool:
+                parts = pool.map(count_shard, paths)
+        else:
+            parts = [count_shard(p) for p in paths]
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    # A patent is in exactly one shard; restore groupby's sorted order
+    out_df = pd.concat(parts, ignore_index=True)
+    return out_df.sort_values("patent_id", ignore_index=True)
+
+
+def sketch_chunk(chunk, precision=PRECISION):
+    """HLL sketches and exact row counts per patent for one cleaned chunk."""
+    part = HLLSketches(precision)
+    cited = chunk.dropna(subset=["citation_patent_id"])
+    part.add(cited["patent_id"], hash_values(cited["citation_patent_id"]))
+    return part, chunk.groupby("patent_id", dropna=False).size()
+
+
+def _sampled(patent_ids, fraction):
+    return hash_values(patent_ids) % 10_000 < fraction * 10_000
+
+
+def report_error(out_df, sample_pairs, precision):
+    """Print how far the estimates are from exact counts on the sampled patents."""
+    print(f"Expected standard error at precision {precision}: {standard_error(precision):.1%} "
+          f"(small counts are close to exact)")
+    if not sample_pairs:
+        return
+    exact = count_clean(pd.concat(sample_pairs, ignore_index=True))
+    exact = exact[exact["citation_unique"] > 0]
+    if exact.empty:
+        return
+    est = out_df.set_index("patent_id")["citation_unique"].reindex(exact["patent_id"]).to_numpy()
+    rel = np.abs(est - exact["citation_unique"].to_numpy()) / exact["citation_unique"].to_numpy()
+    print(f"Checked {len(exact)} patents exactly: mean error {rel.mean():.2%}, "
+          f"p99 {np.percentile(rel, 99):.2%}, max {rel.max():.2%}, "
+          f"exact for {np.mean(rel == 0):.1%}")
+
+
+def count_citations_approx(inp, precision=PRECISION, chunk_rows=CHUNK_ROWS, workers=1,
+                           check_fraction=CHECK_FRACTION, cache=None):
+    sketches = HLLSketches(precision)
+    totals = np.zeros(0, dtype=np.int64)
+    sample_pairs = []
+
+    def fold(result):
+        nonlocal totals
+        part, chunk_totals = result
+        rows = sketches.codes(chunk_totals.index)
+        if len(totals) < len(sketches):
+            totals = np.concatenate([totals, np.zeros(len(sketches) - len(totals), dtype=np.int64)])
+        totals[rows] += chunk_totals.to_numpy()
+        sketches.merge(part)
+
+    chunks = iter_citations(inp, chunk_rows, cache)
+    with Pool(workers) if workers > 1 else nullcontext() as pool:
+        pending = deque()
+        for chunk in chunks:
+            if check_fraction > 0:
+                sample = chunk[_sampled(chunk["patent_id"], check_fraction)]
+                sample_pairs.append(sample.drop_duplicates())
+            if pool is None:
+                fold(sketch_chunk(chunk, precision))
+                continue
+            # At most two chunks per worker in flight, so memory stays bounded
+            pending.append(pool.apply_async(sketch_chunk, (chunk, precision)))
+            while len(pending) >= 2 * workers:
+                fold(pending.popleft().get())
+        while pending:
+            fold(pending.popleft().get())
+
+    estimate = np.minimum(np.rint(sketches.estimate()).astype(np.int64), totals[:len(sketches)])
+    out_df = pd.DataFrame({
+        "patent_id": sketches.keys,
+        "citation_total": totals[:len(sketches)],
+        "citation_unique": estimate,
+    }).sort_values("patent_id", ignore_index=True)
+    print(f"Sketches: {len(sketches)} patents ({sketches.dense} dense), {sketches.nbytes / 1e6:.1f} MB")
+    report_error(out_df, sample_pairs, precision)
+    return out_df
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Count citations made by each patent in a citation TSV.")
+    ap.add_argument("input", help="TSV with patent_id and citation_patent_id (or cited_patent_id).")
+    ap.add_argument("output", nargs="?", default="citation_counts.tsv")
+    ap.add_argument("--streaming", action="store_true",
+                    help="Read in chunks and count hash-partitioned shards on disk (bounded memory).")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                    help=f"Rows per chunk with --streaming/--approx (default: {CHUNK_ROWS}).")
+    ap.add_argument("--shards", type=int, default=SHARDS,
+                    help=f"Shard files with --streaming (default: {SHARDS}).")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Count shards (or sketch chunks) in this many processes (default: 1).")
+    ap.add_argument("--tmp-dir", help="Directory for the shard files (default: system temp).")
+    ap.add_argument("--forward", action="store_true",
+                    help="Also count forward citations (cited_by_total, cited_by_unique).")
+    ap.add_argument("--by-year", metavar="COLUMN",
+                    help="With --forward: also write per-year totals by this column to OUTPUT.by_year.tsv.")
+    ap.add_argument("--check", action="store_true",
+                    help="With --forward: also count forward citations with a plain groupby and "
+                         "stop if the results differ.")
+    ap.add_argument("--approx", action="store_true",
+                    help="Estimate citation_unique with per-patent HyperLogLog sketches (one pass).")
+    ap.add_argument("--precision", type=int, default=PRECISION,
+                    choices=range(MIN_PRECISION, MAX_PRECISION + 1), metavar="P",
+                    help=f"--approx sketch size, at most 2**P bytes per patent "
+                         f"({MIN_PRECISION}-{MAX_PRECISION}, default: {PRECISION}).")
+    ap.add_argument("--check-fraction", type=float, default=CHECK_FRACTION,
+                    help=f"--approx: share of patents also counted exactly to report the error "
+                         f"(default: {CHECK_FRACTION}; 0 turns it off).")
+    add_cache_arguments(ap)
+    args = ap.parse_args()
+    out = args.output
+    cache = cache_from_args(args)
+    if args.forward and (args.streaming or args.approx):
+        ap.error("--forward cannot be combined with --streaming or --approx")
+    if args.by_year and not args.forward:
+        ap.error("--by-year needs --forward")
+    if args.check and not args.forward:
+        ap.error("--check needs --forward")
+
+    if args.forward:
+        df = read_id_columns(args.input, [args.by_year] if args.by_year else (), cache)
+        encoded = _encode(df)
+        out_df = count_both(df, encoded)
+        if args.check:
+            check_forward(df, out_df)
+        if args.by_year:
+            by_year_out = os.path.splitext(out)[0] + ".by_year.tsv"
+            count_by_year(df, args.by_year, encoded).to_csv(by_year_out, sep="\t", index=False)
+            print(f"Wrote: {by_year_out}")
+        del df, encoded
+    elif args.approx:
+        out_df = count_citations_approx(args.input, args.precision, args.chunk_rows,
+                                        args.workers, args.check_fraction, cache)
+    elif args.streaming:
+        out_df = count_citations_streaming(args.input, args.chunk_rows, args.shards,
+                                           args.workers, args.tmp_dir, cache)
+    else:
+        out_df = count_citations(read_citations(args.input, cache))
+
+    # Write TSV
+    out_df.to_csv(out, sep="\t", index=False)
+
+    # Optional: print a quick check for 10000000 if present
+    row = out_df.loc[out_df["patent_id"] == "10000000"]
+    if not row.empty:
+        tot = int(row["citation_total"].iloc[0])
+        uniq = int(row["citation_unique"].iloc[0])
+        print(f"patent_id 10000000 → {tot} citations ({uniq} unique)")
+    else:
+        print("patent_id 10000000 not found.")
+    print(f"Wrote: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,65 @@
-import xml.etree.ElementTree as ET
-import csv
-import sys
+import argparse
 import os
 
+from citation_graph import EdgeWriter, node_key
+from record_filter import add_filter_arguments, filter_from_args
+from row_writers import ROW_GROUP_SIZE, add_output_arguments, open_row_writer
+from run_stats import RunStats, add_stats_arguments
+from xml_records import (
+    add_parse_arguments, compile_xpaths, extract_records, find_first, is_lxml_element,
+)
+
 # --- CONFIGURATION ---
 START_TAG = '<us-patent-grant'
 END_TAG = '</us-patent-grant>'
 
+# Define the columns we want in our CSV
+HEADERS = ['patent_id', 'total_citations', 'cited_patent_ids', 'cited_npl_text']
+
+# Column types for --format parquet (see row_writers)
+COLUMN_TYPES = {
+    'patent_id': 'string',
+    'total_citations': 'int32',
+    'cited_patent_ids': 'string',
+    'cited_npl_text': 'string',
+}
+
+# Paths used per record / per citation, anchored to the DTD's structure so
+# neither backend scans the whole record for them. A record-level path that
+# finds nothing is retried as its *_nested descendant search, for records
+# that keep the element somewhere else. With lxml these run as precompiled XPath.
+PATHS = {
+    'patent_id': "us-bibliographic-data-grant/publication-reference/document-id/doc-number",
+    'patent_id_nested': ".//publication-reference//doc-number",
+    'country': "us-bibliographic-data-grant/publication-reference/document-id/country",
+    'country_nested': ".//publication-reference//country",
+    'refs_cited': "us-bibliographic-data-grant/us-references-cited",
+    'refs_cited_nested': ".//us-references-cited",
+    'cite_doc_number': "document-id/doc-number",
+    'cite_country': "document-id/country",
+    'cite_kind': "document-id/kind",
+    'cite_name': "document-id/name",
+    'othercit': "othercit",
+}
+XPATHS = compile_xpaths(PATHS)
+
 def get_text_safe(element, path):
-    """Helper to get text from a specific path safely."""
+    """Helper to get text from a specific path (or compiled XPath) safely."""
     if element is None:
         return ""
-    found = element.find(path)
+    found = find_first(element, path)
+    return found.text.strip() if found is not None and found.text else ""
+
+def find_in_record(root, paths, name):
+    """First match of paths[name], else of its paths[name + '_nested'] fallback."""
+    found = find_first(root, paths[name])
+    if found is None:
+        found = find_first(root, paths[name + '_nested'])
+    return found
+
+def get_record_text(root, paths, name):
+    """get_text_safe for a record-level path with a *_nested fallback."""
+    found = find_in_record(root, paths, name)
     return found.text.strip() if found is not None and found.text else ""
 
 def extract_citations(root):
@@ -19,16 +67,17 @@ def extract_citations(root):
     Extracts all citations into a single list, regardless of XML nesting.
     """
     data = {}
+    paths = XPATHS if is_lxml_element(root) else PATHS
     
     # 1. Patent ID
-    # We look recursively (.//) because structure varies between Utility vs Design patents
-    doc_node = root.find(".//publication-reference//doc-number")
+    # Falls back to looking recursively (.//) because structure varies between Utility vs Design patents
+    doc_node = find_in_record(root, paths, 'patent_id')
     data['patent_id'] = doc_node.text.strip() if doc_node is not None else "UNKNOWN"
 
     # 2. Extract Citations
-    # We use .//us-references-cited to find the block ANYWHERE in the file
+    # Falls back to searching the block ANYWHERE in the file
     # (It handles both Design patents where it's nested, and Utility where it's not)
-    refs_cited = root.find('.//us-references-cited')
+    refs_cited = find_in_record(root, paths, 'refs_cited')
     
     cited_patents = []
     cited_npl = [] 
@@ -40,10 +89,10 @@ def extract_citations(root):
             # A. Check for Patent Citation (<patcit>)
             patcit = citation.find('patcit')
             if patcit is not None:
-                doc_num = get_text_safe(patcit, ".//document-id/doc-number")
-                country = get_text_safe(patcit, ".//document-id/country")
-                kind = get_text_safe(patcit, ".//document-id/kind")
-                name = get_text_safe(patcit, ".//document-id/name")
+                doc_num = get_text_safe(patcit, paths['cite_doc_number'])
+                country = get_text_safe(patcit, paths['cite_country'])
+                kind = get_text_safe(patcit, paths['cite_kind'])
+                name = get_text_safe(patcit, paths['cite_name'])
                 
                 if doc_num:
                     # Create a clean string: US-7017193-B2 (Auger)
@@ -55,7 +104,7 @@ def extract_citations(root):
             # B. Check for Non-Patent Literature (<nplcit>)
             nplcit = citation.find('nplcit')
             if nplcit is not None:
-                othercit = get_text_safe(nplcit, ".//othercit")
+                othercit = get_text_safe(nplcit, paths['othercit'])
                 if othercit:
                     # Remove newlines to keep CSV clean
                     clean_npl = " ".join(othercit.split())
@@ -71,52 +120,115 @@ def extract_citations(root):
 
     return data
 
-def parse_xml_to_csv(input_file, output_file):
+def extract_citation_edges(root):
+    """
+    (citing node key, [cited node keys]) for --edges. Only patent citations
+    become edges; a patent cited twice by the same grant counts once.
+    """
+    paths = XPATHS if is_lxml_element(root) else PATHS
+    doc_num = get_record_text(root, paths, 'patent_id')
+    if not doc_num:
+        return None
+    citing = node_key(get_record_text(root, paths, 'country'), doc_num)
+
+    cited = []
+    refs_cited = find_in_record(root, paths, 'refs_cited')
+    if refs_cited is not None:
+        for citation in refs_cited.findall('us-citation'):
+            patcit = citation.find('patcit')
+            if patcit is None:
+                continue
+            cited_num = get_text_safe(patcit, paths['cite_doc_number'])
+            if cited_num:
+                key = node_key(get_text_safe(patcit, paths['cite_country']), cited_num)
+                if key not in cited:
+                    cited.append(key)
+    return citing, cited
+
+def parse_xml_to_edges(input_file, prefix, workers=1, ordered=True, backend='auto',
+                       record_filter=None, append=False, stats_json=None):
+    """Write PREFIX.nodes / PREFIX.edges / PREFIX.csr.npz (see citation_graph)."""
     if not os.path.exists(input_file):
         print(f"Error: File {input_file} not found.")
         return
 
-    headers = ['patent_id', 'total_citations', 'cited_patent_ids', 'cited_npl_text']
-
     print(f"Processing: {input_file}")
-    print("Writing to CSV...")
+    print(f"Writing edge list to {prefix}.*")
+
+    writer = EdgeWriter(prefix, append=append)
+    stats = RunStats(input_file)
+    try:
+        count = 0
+        edges = extract_records(input_file, START_TAG, END_TAG, extract_citation_edges,
+                                workers=workers, ordered=ordered, backend=backend,
+                                record_filter=record_filter, stats=stats)
+        for edge in edges:
+            if edge is None:
+                continue
+            writer.add(*edge)
+            count += 1
+    finally:
+        writer.close()
+
+    stats.finish(stats_json)
+    print(f"Success! {writer.edge_count} edges over {len(writer.nodes)} nodes "
+          f"from {count} patents to {prefix}.*")
+
+def parse_xml_to_csv(input_file, output_file, workers=1, ordered=True, backend='auto',
+                     fmt='csv', row_group_size=ROW_GROUP_SIZE, compression='snappy',
+                     record_filter=None, stats_json=None):
+    if not os.path.exists(input_file):
+        print(f"Error: File {input_file} not found.")
+        return
 
-    with open(input_file, 'r', encoding='utf-8') as f_in, \
-         open(output_file, 'w', newline='', encoding='utf-8') as f_out:
-        
-        writer = csv.DictWriter(f_out, fieldnames=headers)
-        writer.writeheader()
+    print(f"Processing: {input_file}")
+    print(f"Writing to {fmt.upper()}...")
 
-        buffer = []
-        inside_record = False
+    writer = open_row_writer(output_file, HEADERS, fmt, COLUMN_TYPES,
+                             row_group_size=row_group_size, compression=compression)
+    stats = RunStats(input_file)
+    try:
         count = 0
 
-        for line in f_in:
-            if START_TAG in line:
-                inside_record = True
-                buffer = [line]
-            elif inside_record:
-                buffer.append(line)
-                if END_TAG in line:
-                    inside_record = False
-                    xml_string = "".join(buffer)
-                    
-                    try:
-                        root = ET.fromstring(xml_string)
-                        row_data = extract_citations(root)
-                        writer.writerow(row_data)
-                        count += 1
-                        
-                        if count % 500 == 0:
-                            print(f"Parsed {count} patents...", end='\r')
-                            
-                    except ET.ParseError:
-                        pass 
-
-    print(f"\nSuccess! Extracted citations for {count} patents to {output_file}")
+        rows = extract_records(input_file, START_TAG, END_TAG, extract_citations,
+                               workers=workers, ordered=ordered, backend=backend,
+                               record_filter=record_filter, stats=stats)
+        for row_data in rows:
+            writer.writerow(row_data)
+            count += 1
+    finally:
+        writer.close()
+
+    stats.finish(stats_json)
+    print(f"Success! Extracted citations for {count} patents to {output_file}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract citations from concatenated USPTO grant XML into CSV or Parquet.")
+    ap.add_argument("input_file", help="Concatenated USPTO XML (.xml, or .zip/.gz/.xz read without unpacking).")
+    ap.add_argument("output_file", help="Output file, or output prefix with --edges.")
+    add_parse_arguments(ap)
+    ap.add_argument("--edges", action="store_true",
+                    help="Instead of rows, write an integer edge list, node dictionary and "
+                         "CSR index as OUTPUT_FILE.nodes/.edges/.csr.npz (see citation_graph.py).")
+    ap.add_argument("--append", action="store_true",
+                    help="With --edges, extend an existing edge list (e.g. the next weekly file).")
+    add_output_arguments(ap)
+    add_filter_arguments(ap)
+    add_stats_arguments(ap)
+    args = ap.parse_args()
+
+    if args.edges:
+        parse_xml_to_edges(args.input_file, args.output_file,
+                           workers=args.workers, ordered=not args.unordered,
+                           backend=args.backend, record_filter=filter_from_args(args),
+                           append=args.append, stats_json=args.stats_json)
+        return
+
+    parse_xml_to_csv(args.input_file, args.output_file,
+                     workers=args.workers, ordered=not args.unordered,
+                     backend=args.backend, fmt=args.format,
+                     row_group_size=args.row_group_size, compression=args.compression,
+                     record_filter=filter_from_args(args), stats_json=args.stats_json)
 
 if __name__ == "__main__":
-    if len(sys.argv) == 3:
-        parse_xml_to_csv(sys.argv[1], sys.argv[2])
-    else:
-        print("Usage: python3 extract_citations.py <input_file.xml> <output_file.csv>")
\ No newline at end of file
+    main()
@@ -0,0 +1,127 @@
+"""
+One pass over a weekly USPTO XML file feeding several extractors.
+
+parser.py, export_xml.py and Parse_xml.py each rescan and reparse the whole
+file. Here every record is split and parsed once, the tree is handed to each
+requested extractor, and every extractor streams its rows to its own CSV.
+
+Usage:
+python3 extract_all.py ipg240102.xml --citations cites.csv --flatten flat.csv
+python3 extract_all.py ipa240104.xml --applications apps.csv --workers 4
+"""
+import argparse
+import os
+
+from record_filter import add_filter_arguments, filter_from_args
+from row_writers import ROW_GROUP_SIZE, add_output_arguments, open_row_writer
+from run_stats import RunStats, add_stats_arguments
+from xml_records import add_parse_arguments, detect_record_tags, extract_records
+
+import parser as applications
+import export_xml as citations
+import Parse_xml as flatten
+
+# name -> (extract function, header, column types, record start tag). A
+# header of None means the columns are discovered while writing (flattened
+# records, CSV only); a start tag of None means any record type.
+EXTRACTORS = {}
+
+def register_extractor(name, extract, headers=None, column_types=None, start_tag=None):
+    """
+    Make an extractor available as --<name> OUTPUT. `extract` takes a parsed
+    root of a start_tag record (e.g. '<us-patent-grant').
+    """
+    EXTRACTORS[name] = (extract, headers, column_types, start_tag)
+
+register_extractor('applications', applications.extract_application_data,
+                   applications.HEADERS, applications.COLUMN_TYPES, applications.START_TAG)
+register_extractor('citations', citations.extract_citations,
+                   citations.HEADERS, citations.COLUMN_TYPES, citations.START_TAG)
+register_extractor('flatten', flatten.flatten_element)
+
+class FanOut:
+    """Runs several extractors on the same root; picklable for worker processes."""
+
+    def __init__(self, functions):
+        self.functions = functions
+
+    def __call__(self, root):
+        return tuple(extract(root) for extract in self.functions)
+
+def open_sink(output_file, name, fmt, row_group_size, compression):
+    _, headers, column_types, _ = EXTRACTORS[name]
+    if headers is None:
+        return flatten.FlatCsvWriter(output_file)
+    return open_row_writer(output_file, headers, fmt, column_types,
+                           row_group_size=row_group_size, compression=compression)
+
+def run(input_file, outputs, workers=1, ordered=True, backend='auto',
+        fmt='csv', row_group_size=ROW_GROUP_SIZE, compression='snappy', record_filter=None,
+        stats_json=None):
+    """
+    outputs: {extractor name: output file}. Every record is parsed once and
+    its rows are written to each output. fmt applies to the fixed-column
+    outputs; flattened rows are always CSV.
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: File {input_file} not found.")
+        return
+
+    tags = detect_record_tags(input_file)
+    if tags is None:
+        print(f"Error: no <us-patent-grant> or <us-patent-application> records in {input_file}.")
+        return
+
+    names = list(outputs)
+    for name in names:
+        start_tag = EXTRACTORS[name][3]
+        if start_tag not in (None, tags[0]):
+            print(f"Error: --{name} needs {start_tag[1:]} records; "
+                  f"{input_file} has {tags[0][1:]} records.")
+            return
+
+    fan_out = FanOut([EXTRACTORS[name][0] for name in names])
+    sinks = [open_sink(outputs[name], name, fmt, row_group_size, compression)
+             for name in names]
+
+    print(f"Processing: {input_file} ({tags[0][1:]} records)")
+    print("Writing to: " + ", ".join(f"{name} -> {outputs[name]}" for name in names))
+
+    count = 0
+    stats = RunStats(input_file)
+    try:
+        for rows in extract_records(input_file, tags[0], tags[1], fan_out,
+                                    workers=workers, ordered=ordered, backend=backend,
+                                    record_filter=record_filter, stats=stats):
+            for sink, row in zip(sinks, rows):
+                sink.writerow(row)
+            count += 1
+    finally:
+        for sink in sinks:
+            sink.close()
+
+    stats.finish(stats_json)
+    print(f"Success! Extracted {count} records into {len(sinks)} output(s)")
+
+def main():
+    ap = argparse.ArgumentParser(description="Parse a USPTO bulk XML file once and run several extractors on it.")
+    ap.add_argument("input_file", help="Concatenated USPTO XML (.xml, or .zip/.gz/.xz read without unpacking).")
+    for name in EXTRACTORS:
+        ap.add_argument(f"--{name}", metavar="OUTPUT", help=f"Write {name} rows to this file.")
+    add_parse_arguments(ap)
+    add_output_arguments(ap)
+    add_filter_arguments(ap)
+    add_stats_arguments(ap)
+    args = ap.parse_args()
+
+    outputs = {name: getattr(args, name) for name in EXTRACTORS if getattr(args, name)}
+    if not outputs:
+        ap.error("choose at least one output: " + ", ".join(f"--{name}" for name in EXTRACTORS))
+
+    run(args.input_file, outputs, workers=args.workers, ordered=not args.unordered,
+        backend=args.backend, fmt=args.format, row_group_size=args.row_group_size,
+        compression=args.compression, record_filter=filter_from_args(args),
+        stats_json=args.stats_json)
+
+if __name__ == "__main__":
+    main()
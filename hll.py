@@ -0,0 +1,254 @@
+"""
+HyperLogLog distinct-count sketches, one per key, updated in bulk with numpy.
+
+Values are hashed to 64 bits. A dense sketch is a row of 2**precision
+one-byte registers: the top `precision` bits of a hash pick a register and
+the register keeps the largest "leading zeros + 1" seen in the remaining
+bits. Two sketches over the same hash are merged by taking the
+register-wise maximum, so sketches built from different chunks or in
+different processes combine into the sketch of all the data.
+
+Most keys see far fewer values than a dense row has registers, so, as in
+HLL++, a key starts in sparse mode: a sorted list of 4-byte entries that
+hold the top SPARSE_PRECISION bits of each hash (plus the rank when it
+cannot be recovered from them). Sparse counts are linear counting over
+2**SPARSE_PRECISION slots, i.e. practically exact. A key whose list would
+outgrow its dense row (2**precision / 8 entries, as each one is stored with
+its row in 8 bytes) is converted to registers; the conversion gives exactly
+the registers adding its values densely would have. Memory is therefore at
+most 2**precision bytes per key, and about 8 bytes per distinct value for
+the many small ones.
+
+The standard error of a dense estimate is about 1.04 / sqrt(2**precision)
+for large counts; small counts (fewer values than registers) use linear
+counting and are close to exact.
+"""
+import numpy as np
+import pandas as pd
+
+# About 0.8% standard error once a key is dense; keys that stay sparse are
+# practically exact however large the dense rows are
+PRECISION = 14
+MIN_PRECISION, MAX_PRECISION = 4, 16
+SPARSE_PRECISION = 25
+
+# Values hashed per call; hashing strings makes several temporary copies of
+# its input, so large Series are done in slices
+HASH_BATCH = 262_144
+
+# New sparse entries are buffered and merged into the sorted list once they
+# reach a quarter of it (or this many), so each merge's cost is amortized
+COMPACT_ENTRIES = 1 << 20
+
+_ROW_SHIFT = np.uint64(32)
+_SLOT_SHIFT = np.uint64(7)
+_VALUE_MASK = np.uint64(0xFFFFFFFF)
+
+
+def hash_values(values):
+    """64-bit hashes of a Series' values (stable across processes and runs)."""
+    out = np.empty(len(values), dtype=np.uint64)
+    for start in range(0, len(values), HASH_BATCH):
+        part = values.iloc[start:start + HASH_BATCH]
+        out[start:start + len(part)] = pd.util.hash_pandas_object(part, index=False, categorize=False)
+    return out
+
+
+def _bit_length(x):
+    """Bit length of each uint64 (0 for 0), exactly, via float64 on 32-bit halves."""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide='ignore'):
+        hi_len = np.where(hi > 0, np.floor(np.log2(hi)) + 33, 0)
+        lo_len = np.where(lo > 0, np.floor(np.log2(lo)) + 1, 0)
+    return np.where(hi_len > 0, hi_len, lo_len).astype(np.int64)
+
+
+def register_updates(hashes, precision=PRECISION):
+    """(register index, rank) for each hash."""
+    shift = np.uint64(64 - precision)
+    index = (hashes >> shift).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = (64 - precision) - _bit_length(rest) + 1
+    return index, rank.astype(np.uint8)
+
+
+def sparse_entries(hashes, precision=PRECISION):
+    """
+    32-bit sparse encoding of each hash: the top SPARSE_PRECISION bits
+    (the slot), then the rank of the remaining bits and a flag when the
+    slot bits below the register index are all zero (the rank cannot be
+    told from the slot then).
+    """
+    low_bits = 64 - SPARSE_PRECISION
+    slot = hashes >> np.uint64(low_bits)
+    between = slot & np.uint64((1 << (SPARSE_PRECISION - precision)) - 1)
+    rank = low_bits - _bit_length(hashes & np.uint64((1 << low_bits) - 1)) + 1
+    flagged = (rank.astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+    entries = (slot << _SLOT_SHIFT) | np.where(between == 0, flagged, np.uint64(0))
+    return entries.astype(np.uint32)
+
+
+def sparse_register_updates(entries, precision=PRECISION):
+    """(register index, rank) for each sparse entry, as register_updates gives for its hash."""
+    entries = entries.astype(np.uint64)
+    slot = entries >> _SLOT_SHIFT
+    extra = SPARSE_PRECISION - precision
+    index = (slot >> np.uint64(extra)).astype(np.int64)
+    between = slot & np.uint64((1 << extra) - 1)
+    stored = ((entries >> np.uint64(1)) & np.uint64(63)).astype(np.int64) + extra
+    rank = np.where(entries & np.uint64(1), stored, extra - _bit_length(between) + 1)
+    return index, rank.astype(np.uint8)
+
+
+def standard_error(precision=PRECISION):
+    return 1.04 / np.sqrt(2 ** precision)
+
+
+def _first_of_runs(sorted_values):
+    first = np.ones(len(sorted_values), dtype=bool)
+    first[1:] = sorted_values[1:] != sorted_values[:-1]
+    return first
+
+
+class HLLSketches:
+    """Distinct-count sketches keyed by arbitrary hashable keys (strings here)."""
+
+    def __init__(self, precision=PRECISION):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be {MIN_PRECISION}..{MAX_PRECISION}")
+        self.precision = precision
+        self.m = 2 ** precision
+        self.max_sparse = self.m // 8
+        self.keys = pd.Index([], dtype=object)
+        # Register row of each key, -1 while it is sparse
+        self.dense_rows = np.zeros(0, dtype=np.int32)
+        self.dense = 0
+        self.registers = np.zeros((0, self.m), dtype=np.uint8)
+        # Sorted, unique (key row << 32 | sparse entry); _pending is not merged in yet
+        self.sparse = np.zeros(0, dtype=np.uint64)
+        self._pending = []
+        self._pending_len = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return (self.registers.nbytes + self.sparse.nbytes + 8 * self._pending_len
+                + self.dense_rows.nbytes)
+
+    def codes(self, keys):
+        """Row of each key, adding rows for keys not seen before."""
+        local, uniques = pd.factorize(pd.Series(keys), use_na_sentinel=False)
+        rows = self.keys.get_indexer(uniques)
+        new = rows < 0
+        if new.any():
+            start = len(self.keys)
+            self.keys = self.keys.append(pd.Index(uniques[new], dtype=object))
+            self.dense_rows = np.concatenate([self.dense_rows, np.full(new.sum(), -1, dtype=np.int32)])
+            rows[new] = np.arange(start, len(self.keys))
+        return rows[local]
+
+    def _grow(self, rows):
+        if rows <= len(self.registers):
+            return
+        grown = np.zeros((max(rows, 2 * len(self.registers)), self.m), dtype=np.uint8)
+        grown[:self.dense] = self.registers[:self.dense]
+        self.registers = grown
+
+    def add(self, keys, hashes):
+        """Add one hashed value per key (keys and hashes are aligned)."""
+        if len(keys) == 0:
+            return
+        self._add_entries(self.codes(keys), sparse_entries(hashes, self.precision))
+
+    def _add_entries(self, rows, entries):
+        dense = self.dense_rows[rows]
+        is_dense = dense >= 0
+        if is_dense.any():
+            index, rank = sparse_register_updates(entries[is_dense], self.precision)
+            np.maximum.at(self.registers, (dense[is_dense], index), rank)
+        sparse = ~is_dense
+        if not sparse.any():
+            return
+        new = np.unique((rows[sparse].astype(np.uint64) << _ROW_SHIFT) | entries[sparse].astype(np.uint64))
+        self._pending.append(new)
+        self._pending_len += len(new)
+        if self._pending_len >= max(len(self.sparse) // 4, COMPACT_ENTRIES):
+            self._compact()
+
+    def _compact(self):
+        """Merge pending entries into the sorted list and convert keys that outgrew it."""
+        if not self._pending:
+            return
+        merged = np.concatenate([self.sparse, *self._pending])
+        self._pending, self._pending_len = [], 0
+        merged.sort(kind='stable')  # sorted runs, merged rather than re-sorted
+        merged = merged[_first_of_runs(merged)]
+        slot_rows = (merged[_first_of_runs(merged >> _SLOT_SHIFT)] >> _ROW_SHIFT).astype(np.int64)
+        full = np.flatnonzero(np.bincount(slot_rows, minlength=len(self)) > self.max_sparse)
+        if len(full):
+            moving = np.isin(merged >> _ROW_SHIFT, full.astype(np.uint64))
+            self._to_dense(full, merged[moving])
+            merged = merged[~moving]
+        self.sparse = merged
+
+    def _to_dense(self, rows, sparse):
+        """Give `rows` register rows, filled from their sparse entries."""
+        self._grow(self.dense + len(rows))
+        self.dense_rows[rows] = np.arange(self.dense, self.dense + len(rows))
+        self.dense += len(rows)
+        index, rank = sparse_register_updates(sparse & _VALUE_MASK, self.precision)
+        dense = self.dense_rows[(sparse >> _ROW_SHIFT).astype(np.int64)]
+        np.maximum.at(self.registers, (dense, index), rank)
+
+    def merge(self, other):
+        """Fold another sketch set (same precision) into this one."""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precision")
+        if len(other) == 0:
+            return
+        other._compact()
+        rows = self.codes(other.keys)  # keys are unique, so rows are too
+        # Dense first, so that other's sparse entries for those keys go straight to registers
+        theirs = np.flatnonzero(other.dense_rows >= 0)
+        if len(theirs):
+            ours = rows[theirs]
+            still_sparse = ours[self.dense_rows[ours] < 0]
+            if len(still_sparse):
+                self._compact()
+                moving = np.isin(self.sparse >> _ROW_SHIFT, still_sparse.astype(np.uint64))
+                self._to_dense(still_sparse, self.sparse[moving])
+                self.sparse = self.sparse[~moving]
+            dense = self.dense_rows[ours]
+            self.registers[dense] = np.maximum(self.registers[dense],
+                                               other.registers[other.dense_rows[theirs]])
+        if len(other.sparse):
+            self._add_entries(rows[(other.sparse >> _ROW_SHIFT).astype(np.int64)],
+                              other.sparse & _VALUE_MASK)
+
+    def estimate(self, block_rows=65536):
+        """Estimated distinct count per key, in the order of self.keys."""
+        self._compact()
+        out = np.zeros(len(self), dtype=np.float64)
+
+        # Sparse keys: linear counting over the occupied slots
+        slot_rows = (self.sparse[_first_of_runs(self.sparse >> _SLOT_SHIFT)] >> _ROW_SHIFT).astype(np.int64)
+        slots = np.bincount(slot_rows, minlength=len(self))
+        sparse_m = 2.0 ** SPARSE_PRECISION
+        sparse = self.dense_rows < 0
+        out[sparse] = sparse_m * np.log(sparse_m / (sparse_m - slots[sparse]))
+
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        dense = np.empty(self.dense, dtype=np.float64)
+        for start in range(0, self.dense, block_rows):
+            regs = self.registers[start:min(start + block_rows, self.dense)]
+            raw = alpha * m * m / np.ldexp(1.0, -regs.astype(np.int32)).sum(axis=1)
+            zeros = (regs == 0).sum(axis=1)
+            with np.errstate(divide='ignore'):
+                linear = m * np.log(m / np.maximum(zeros, 1))
+            dense[start:start + len(regs)] = np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+        out[~sparse] = dense[self.dense_rows[~sparse]]
+        return out
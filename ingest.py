@@ -0,0 +1,214 @@
+"""
+Incremental weekly ingestion of USPTO bulk XML into a local SQLite store.
+
+Instead of rerunning parser.py/export_xml.py over every file and gluing the
+CSVs together by hand, each new weekly file is loaded once:
+- files already loaded (same name and size) are skipped
+- every record is hashed; records whose bytes are unchanged since they were
+  last loaded are skipped without parsing
+- new or corrected records are extracted and upserted by patent_id
+  (application files -> applications table, grant files -> citations table)
+
+Usage:
+python3 ingest.py load patents.db ~/uspto/ipg240102.zip ~/uspto/ipa240104.zip
+python3 ingest.py load patents.db ~/uspto --glob "ip*.zip"
+python3 ingest.py export patents.db citations citations.csv
+"""
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import parser as applications
+import export_xml as citations
+from record_filter import DOC_NUMBER_RE
+from xml_records import (
+    APPLICATION_TAGS, GRANT_TAGS, PARSE_ERRORS, add_parse_arguments, detect_record_tags,
+    iter_records, parse_record, resolve_backend,
+)
+
+# record start tag -> (table, extract function, columns)
+TABLES = {
+    APPLICATION_TAGS[0]: ('applications', applications.extract_application_data,
+                          applications.HEADERS),
+    GRANT_TAGS[0]: ('citations', citations.extract_citations, citations.HEADERS),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingested_files (
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    upserted INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL,
+    PRIMARY KEY (name, size)
+);
+CREATE TABLE IF NOT EXISTS record_hashes (
+    record_table TEXT NOT NULL,
+    patent_id TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    source_file TEXT NOT NULL,
+    PRIMARY KEY (record_table, patent_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS applications (
+    patent_id TEXT PRIMARY KEY,
+    date TEXT,
+    section TEXT,
+    num_claims INTEGER,
+    title TEXT,
+    abstract TEXT,
+    claims_text TEXT,
+    source_file TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS citations (
+    patent_id TEXT PRIMARY KEY,
+    total_citations INTEGER,
+    cited_patent_ids TEXT,
+    cited_npl_text TEXT,
+    source_file TEXT NOT NULL
+);
+"""
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _upsert_sql(table, columns):
+    cols = list(columns) + ['source_file']
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != 'patent_id')
+    return (f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT(patent_id) DO UPDATE SET {updates}")
+
+
+def ingest_file(conn, path, backend='etree'):
+    """
+    Load one bulk file in a single transaction. Returns (records, upserted),
+    or None if a file with the same name and size was loaded before.
+    """
+    name = os.path.basename(path)
+    size = os.path.getsize(path)
+    if conn.execute("SELECT 1 FROM ingested_files WHERE name = ? AND size = ?",
+                    (name, size)).fetchone():
+        return None
+
+    tags = detect_record_tags(path)
+    if tags is None:
+        raise ValueError(f"{path}: no <us-patent-grant> or <us-patent-application> records.")
+    table, extract, columns = TABLES[tags[0]]
+    upsert = _upsert_sql(table, columns)
+
+    records = upserted = 0
+    with conn:
+        for record in iter_records(path, tags[0], tags[1]):
+            records += 1
+            m = DOC_NUMBER_RE.search(record)
+            if m is None:
+                continue
+            record_id = m.group(1).decode('utf-8', 'replace')
+            digest = hashlib.blake2b(record, digest_size=16).digest()
+            known = conn.execute(
+                "SELECT hash FROM record_hashes WHERE record_table = ? AND patent_id = ?",
+                (table, record_id),
+            ).fetchone()
+            if known and known[0] == digest:
+                continue
+
+            try:
+                row = extract(parse_record(record, backend))
+            except PARSE_ERRORS:
+                continue
+            if not row.get('patent_id'):
+                continue
+            conn.execute(upsert, [row.get(c, '') for c in columns] + [name])
+            conn.execute(
+                "INSERT OR REPLACE INTO record_hashes VALUES (?, ?, ?, ?)",
+                (table, record_id, digest, name),
+            )
+            upserted += 1
+            if upserted % 500 == 0:
+                print(f"Upserted {upserted} {table} rows...", end='\r')
+
+        conn.execute(
+            "INSERT INTO ingested_files VALUES (?, ?, ?, ?, ?, ?)",
+            (name, size, os.path.abspath(path), records, upserted,
+             time.strftime('%Y-%m-%d %H:%M:%S')),
+        )
+    return records, upserted
+
+
+def collect_inputs(inputs, pattern):
+    """Files as given, directories expanded with pattern; sorted by name so later weeks win."""
+    files = []
+    for p in map(Path, inputs):
+        files += sorted(p.glob(pattern)) if p.is_dir() else [p]
+    return sorted(set(files), key=lambda p: (p.name, str(p)))
+
+
+def load(db_path, inputs, pattern="*", backend='auto'):
+    backend = resolve_backend(backend)
+    conn = connect(db_path)
+    try:
+        for path in collect_inputs(inputs, pattern):
+            print(f"Ingesting: {path}")
+            try:
+                result = ingest_file(conn, str(path), backend=backend)
+            except ValueError as exc:
+                print(f"Error: {exc}")
+                continue
+            if result is None:
+                print(" -> already loaded, skipped")
+            else:
+                print(f"\n -> {result[0]} records, {result[1]} new or changed")
+    finally:
+        conn.close()
+
+
+def export(db_path, table, output_file):
+    """Write one table back out as CSV with the extractor's columns."""
+    columns = {t: c for t, _, c in TABLES.values()}[table]
+    conn = sqlite3.connect(db_path)
+    try:
+        with open(output_file, 'w', newline='', encoding='utf-8') as f_out:
+            writer = csv.writer(f_out)
+            writer.writerow(columns)
+            cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY patent_id")
+            count = 0
+            for row in cursor:
+                writer.writerow(row)
+                count += 1
+    finally:
+        conn.close()
+    print(f"Wrote {count} {table} rows to {output_file}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Incrementally load USPTO bulk XML into a local SQLite store.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    ld = sub.add_parser("load", help="Ingest new weekly files.")
+    ld.add_argument("db", help="SQLite database (created if missing).")
+    ld.add_argument("inputs", nargs="+", help="Bulk XML files (.xml/.zip/.gz/.xz) or directories.")
+    ld.add_argument("--glob", default="*", help="Pattern for files inside directories (default: *).")
+    add_parse_arguments(ld, workers=False)
+
+    ex = sub.add_parser("export", help="Dump a table to CSV.")
+    ex.add_argument("db")
+    ex.add_argument("table", choices=sorted(t for t, _, _ in TABLES.values()))
+    ex.add_argument("output_file")
+    args = ap.parse_args()
+
+    if args.command == "load":
+        load(args.db, args.inputs, pattern=args.glob, backend=args.backend)
+    else:
+        export(args.db, args.table, args.output_file)
+
+
+if __name__ == "__main__":
+    main()
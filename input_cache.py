@@ -0,0 +1,238 @@
+"""
+Cache of parsed CSV/TSV inputs as typed Parquet files.
+
+The cache is opt-in (--cache): it writes a Parquet copy of every input it
+reads, which for the claims files is many GB. The first time a file is read
+through InputCache it is parsed with pandas.read_csv as usual and a Parquet
+copy (same columns, same dtypes) is stored in the cache directory. Later
+reads with the same options load the Parquet copy (memory-mapped) instead of
+parsing text again.
+
+An entry is keyed by the file's absolute path, size and mtime plus the
+read_csv options, so editing or replacing the file, or asking for other
+columns or dtypes, makes a new entry. A chunked read of only some columns
+uses the full entry if there is one, and otherwise parses and caches just
+those columns. When the cache grows past its size limit the least recently
+used entries are deleted; a copy that alone would exceed the limit is not
+kept (with a message) rather than emptying the cache for it.
+
+pyarrow is needed for the cache; without it the files are simply parsed
+every time.
+
+Usage (maintenance):
+python3 input_cache.py list
+python3 input_cache.py clear --cache-dir /scratch/patent-cache
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CACHE_DIR = os.environ.get('PATENT_INPUT_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'patent-inputs'))
+MAX_BYTES = 20 * 1024 ** 3
+
+SUFFIX = '.parquet'
+
+# Rows converted to Arrow at a time when a whole-file read fills its entry
+FILL_ROWS = 200_000
+
+
+def _schema_for_chunks(schema):
+    """
+    Widen dictionary (categorical) indices to int32 so later chunks with more
+    categories than the first still fit the writer's schema.
+    """
+    return pa.schema([
+        pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type), f.nullable)
+        if pa.types.is_dictionary(f.type) else f
+        for f in schema
+    ], metadata=schema.metadata)
+
+
+class InputCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return pq is not None
+
+    def key(self, path, read_options):
+        st = os.stat(path)
+        options = {k: v for k, v in read_options.items() if k not in ('engine', 'chunksize')}
+        ident = repr((os.path.abspath(path), st.st_size, st.st_mtime_ns, sorted(options.items())))
+        return hashlib.blake2b(ident.encode('utf-8'), digest_size=16).hexdigest()
+
+    def entry_path(self, path, read_options):
+        """<cache_dir>/<file name>-<key>.parquet"""
+        name = f"{os.path.basename(path)}-{self.key(path, read_options)}{SUFFIX}"
+        return os.path.join(self.cache_dir, name)
+
+    def _hit(self, entry):
+        if not os.path.exists(entry):
+            return False
+        os.utime(entry)  # LRU: mtime is the last use
+        return True
+
+    def read_csv(self, path, **read_options):
+        """pandas.read_csv(path, **read_options), from the cache when possible."""
+        if not self.enabled:
+            return pd.read_csv(path, **read_options)
+        entry = self.entry_path(path, read_options)
+        if self._hit(entry):
+            return pq.read_table(entry, memory_map=True).to_pandas()
+
+        df = pd.read_csv(path, **read_options)
+        # Written in row slices, so only one slice at a time is copied to Arrow
+        slices = (df.iloc[start:start + FILL_ROWS] for start in range(0, len(df), FILL_ROWS))
+        for _ in self._fill(path, entry, slices):
+            pass
+        return df
+
+    def iter_csv(self, path, chunk_rows, columns=None, **read_options):
+        """
+        pandas.read_csv(path, chunksize=chunk_rows, **read_options) as an
+        iterator of DataFrames, optionally only `columns` of them. A hit
+        reads just the requested columns. On a miss only `columns` are
+        parsed and cached (as their own entry), and the entry is filled
+        chunk by chunk, so the whole file is never in memory.
+        """
+        if not self.enabled:
+            yield from pd.read_csv(path, chunksize=chunk_rows, usecols=columns, **read_options)
+            return
+        entry = self.entry_path(path, read_options)
+        if columns is not None and not os.path.exists(entry):
+            read_options = dict(read_options, usecols=columns)
+            entry = self.entry_path(path, read_options)
+        if self._hit(entry):
+            parquet = pq.ParquetFile(entry, memory_map=True)
+            for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+                yield batch.to_pandas()
+            return
+
+        chunks = pd.read_csv(path, chunksize=chunk_rows, **read_options)
+        for chunk in self._fill(path, entry, chunks):
+            yield chunk[columns] if columns is not None else chunk
+
+    def _fill(self, path, entry, chunks):
+        """
+        Yield the chunks while writing them to a temporary Parquet file that
+        becomes `entry` (atomically) at the end. If the copy outgrows
+        max_bytes it is dropped and the remaining chunks are only yielded.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        writer = None
+        caching = True
+        try:
+            for chunk in chunks:
+                if caching:
+                    if writer is None:
+                        schema = _schema_for_chunks(pa.Schema.from_pandas(chunk, preserve_index=False))
+                        writer = pq.ParquetWriter(tmp, schema)
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                    if os.path.getsize(tmp) > self.max_bytes:
+                        caching = False
+                        writer.close()
+                        os.remove(tmp)
+                        self._too_large(path)
+                yield chunk
+        except BaseException:
+            if caching and writer is not None:
+                writer.close()
+                os.remove(tmp)
+            raise
+        if not caching or writer is None:
+            return
+        writer.close()
+        if os.path.getsize(tmp) > self.max_bytes:
+            os.remove(tmp)
+            self._too_large(path)
+            return
+        os.replace(tmp, entry)
+        self.evict(keep=entry)
+
+    def _too_large(self, path):
+        print(f"Not caching {path}: its Parquet copy is larger than the "
+              f"{self.max_bytes / 1024 ** 3:.3g} GB cache limit (--cache-max-gb).", file=sys.stderr)
+
+    def entries(self):
+        """[(path, size, last used)] for every cache entry, least recently used first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(SUFFIX):
+                p = os.path.join(self.cache_dir, name)
+                st = os.stat(p)
+                found.append((p, st.st_size, st.st_mtime))
+        return sorted(found, key=lambda e: e[2])
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used entries until the cache fits max_bytes.
+        `keep` (the entry just stored, never larger than max_bytes) goes last.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for p, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if p == keep:
+                continue
+            os.remove(p)
+            total -= size
+
+    def clear(self):
+        for p, _, _ in self.entries():
+            os.remove(p)
+
+
+def add_cache_arguments(ap):
+    ap.add_argument("--cache", action="store_true",
+                    help="Keep a Parquet copy of each parsed input in --cache-dir and reuse it on "
+                         "later runs (off by default; the copies take about as much disk as the inputs).")
+    ap.add_argument("--cache-dir", default=CACHE_DIR,
+                    help=f"Parsed-input cache directory (default: {CACHE_DIR}, or $PATENT_INPUT_CACHE).")
+    ap.add_argument("--cache-max-gb", type=float, default=MAX_BYTES / 1024 ** 3,
+                    help=f"Cache size limit; least recently used entries go first, and an input "
+                         f"whose copy alone is larger is not cached (default: {MAX_BYTES / 1024 ** 3:.0f}).")
+
+
+def cache_from_args(args):
+    """InputCache from add_cache_arguments options, or None without --cache."""
+    if not args.cache:
+        return None
+    return InputCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or empty the parsed-input cache.")
+    ap.add_argument("command", choices=("list", "clear"))
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    args = ap.parse_args()
+
+    cache = InputCache(args.cache_dir)
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {args.cache_dir}")
+        return
+    entries = cache.entries()
+    for p, size, used in entries:
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  {size / 1e6:10.1f} MB  {p}")
+    print(f"{len(entries)} entries, {sum(s for _, s, _ in entries) / 1e6:.1f} MB in {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
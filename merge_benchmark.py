@@ -0,0 +1,125 @@
+"""
+Benchmark the merger.py --inputs backends (pandas and the compiled
+Merger.c) on generated inputs.
+
+Writes a bibliographic CSV, a TSV of extra metadata and two claims files
+(claims_2023.tsv with several rows per patent, claims_2024.csv with one)
+for --ids patents, with a few NA/N/A/null/NaN cells, runs merger.py once
+per backend as its own process and reports wall time and peak memory. With the default --sample (every
+eligible ID) both backends write the same rows, in different orders, and
+the outputs are compared after sorting.
+
+Usage:
+python3 merge_benchmark.py --ids 200000
+python3 merge_benchmark.py --ids 1000000 --repeat 3 --work-dir /scratch/merge-bench
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import c_merger
+from benchmark import run_one
+from synth_xml import WORDS
+
+BACKENDS = ('pandas', 'c')
+FILES = ('bib.csv', 'meta.tsv', 'claims_2023.tsv', 'claims_2024.csv')
+
+
+# Cells pandas would read as missing by default; both backends must copy them as text
+NA_CELLS = ('NA', 'N/A', 'null', 'NaN')
+
+
+def _words(rng, n):
+    # No commas or quotes: Merger.c writes fields unquoted
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _maybe_na(rng, value):
+    return rng.choice(NA_CELLS) if rng.random() < 0.02 else value
+
+
+def write_inputs(work_dir, ids, seed=0):
+    """The FILES for `ids` patents in work_dir, each holding a random share of them."""
+    rng = random.Random(seed)
+    numbers = [str(10000000 + i) for i in range(ids)]
+    paths = [os.path.join(work_dir, name) for name in FILES]
+    bib, meta, claims_2023, claims_2024 = (open(p, 'w', encoding='utf-8') for p in paths)
+    with bib, meta, claims_2023, claims_2024:
+        bib.write("patent_number,title,assignee,year\n")
+        meta.write("id\tpatent_id\tkind\tcpc_sections\n")
+        claims_2023.write("patent_id\tclaim_sequence\tclaim_text\n")
+        claims_2024.write("patent_id,claim_sequence,claim_text\n")
+        for i, number in enumerate(numbers):
+            if rng.random() < 0.9:
+                assignee = _maybe_na(rng, f"{rng.choice(WORDS).capitalize()} Inc")
+                bib.write(f"{number},{_words(rng, 6)},{assignee},2023\n")
+            if rng.random() < 0.8:
+                meta.write(f"{i}\t{number}\t{rng.choice('AB')}\t{_maybe_na(rng, rng.choice('ABCDEFGH'))}\n")
+            if rng.random() < 0.5:
+                for s in range(rng.randint(1, 5)):
+                    claims_2023.write(f"{number}\t{s}\t{_words(rng, 30)}\n")
+            if rng.random() < 0.3:
+                claims_2024.write(f"{number},0,{_words(rng, 30)}\n")
+    return paths
+
+
+def _sorted_lines(path):
+    with open(path, encoding='utf-8') as f:
+        header = f.readline()
+        return header, sorted(f)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare the pandas and C backends of merger.py --inputs.")
+    ap.add_argument("--ids", type=int, default=100_000, help="Patents in the generated inputs (default: 100000).")
+    ap.add_argument("--sample", type=int, help="IDs to write (default: all eligible, so outputs can be compared).")
+    ap.add_argument("--repeat", type=int, default=1, help="Runs per backend; the fastest counts.")
+    ap.add_argument("--work-dir", help="Keep/reuse the generated inputs here (default: temporary).")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="merge_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        paths = [os.path.join(work_dir, name) for name in FILES]
+        if not all(os.path.exists(p) for p in paths):
+            print(f"Generating inputs for {args.ids} patents in {work_dir}")
+            paths = write_inputs(work_dir, args.ids, args.seed)
+        input_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+
+        # Build outside the timed runs
+        try:
+            binary = c_merger.build()
+        except c_merger.BuildError as e:
+            print(e)
+            binary = None
+        backends = BACKENDS if binary else ('pandas',)
+        if binary is None:
+            print("No usable C compiler; benchmarking pandas only.")
+
+        outputs = {}
+        for backend in backends:
+            out = os.path.join(work_dir, f"merged_{backend}.csv")
+            argv = [sys.executable, 'merger.py', '--inputs', *paths, '--out', out,
+                    '--sample', str(args.sample or args.ids), '--backend', backend]
+            runs = [run_one(argv, out + '.log') for _ in range(args.repeat)]
+            seconds = min(s for s, _ in runs)
+            peak = max(p for _, p in runs)
+            outputs[backend] = out
+            print(f"{backend:<8} {seconds:>8.2f}s {input_mb / seconds:>7.1f} MB/s {peak:>8.1f} MB peak")
+
+        if len(outputs) == 2 and args.sample is None:
+            same = _sorted_lines(outputs['pandas']) == _sorted_lines(outputs['c'])
+            print("Outputs match." if same else "Outputs DIFFER.")
+            if not same:
+                sys.exit(1)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
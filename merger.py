@@ -1,23 +1,106 @@
+"""
+Join bibliographic rows (2024.csv) with PatentsView claims (g_claims_2024.tsv)
+into combined.csv, one row per claim.
+
+By default both files are loaded and merged in memory. Only the columns the
+output needs are read, with explicit dtypes (categorical for the section and
+WIPO title columns, which repeat on every claim row), optionally with pyarrow's
+multi-threaded CSV reader (--engine pyarrow). Read/merge/write times, frame
+sizes and peak memory are printed as it goes.
+
+--streaming keeps only the bibliographic side in memory: it is indexed by
+patent_number once, and the claims file is read in chunks that are matched
+against the index and appended to the output, so memory no longer grows with
+the size of the claims file. Rows then come out in claims file order rather
+than bibliographic file order.
+
+--inputs merges any number of CSV/TSV files by patent ID with the rules of
+Merger.c: delimiters and ID columns are detected per file, files named
+claims_<YYYY> form the claims group (their columns get a _YYYY suffix), an ID
+is eligible if it is in every other file and in at least one claims file, and
+--sample N eligible IDs are picked at random. Only the ID columns are held in
+memory for the eligibility check; the files are then streamed a second time
+and only the sampled rows are kept.
+
+--backend c runs the --inputs merge with the compiled Merger.c instead (built
+on first use and cached, see c_merger.py), falling back to pandas when no C
+compiler is available. Merger.c samples with an unseeded shuffle, writes the
+rows in that shuffled order without CSV quoting and always keeps the last row
+of a repeated ID, so --seed and --duplicates only apply to pandas.
+
+With --cache, parsed inputs are kept as typed Parquet (see input_cache.py),
+so repeated runs over the same files skip the CSV parsing.
+
+Usage:
+python3 merger.py
+python3 merger.py --streaming --bib 2024.csv --claims g_claims_2024.tsv --out combined.csv
+python3 merger.py --inputs 2023.csv 2024.csv claims_2023.tsv claims_2024.tsv --sample 5000 --out merged.csv
+python3 merger.py --inputs 2024.csv claims_2024.tsv --backend c
+"""
+import argparse
+import csv
+import os
+import re
+import time
+
+import numpy as np
 import pandas as pd
 
-# Read the first file 
-df1 = pd.read_csv('2024.csv')
+import c_merger
+from input_cache import add_cache_arguments, cache_from_args
+
+try:
+    import pyarrow  # noqa: F401  (enables engine='pyarrow' in read_csv)
+except ImportError:
+    pyarrow = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
-# Read the second file
-df2 = pd.read_csv('g_claims_2024.tsv', sep='\t')
+BIB_FILE = '2024.csv'
+CLAIMS_FILE = 'g_claims_2024.tsv'
+OUTPUT_FILE = 'combined.csv'
 
-# Merge on patent identifiers 
-merged = pd.merge(
-    df1,
-    df2,
-    left_on='patent_number',
-    right_on='patent_id',
-    how='inner'
-)
+# Join keys
+BIB_KEY = 'patent_number'
+CLAIMS_KEY = 'patent_id'
+
+# Columns each side contributes
+BIB_COLUMNS = ['patent_number', 'cpc_sections', 'ipc_sections', 'assignee', 'wipo_field_ids',
+               'first_wipo_field_title', 'first_wipo_sector_title']
+CLAIMS_COLUMNS = ['patent_id', 'claim_sequence', 'claim_text']
+
+# Explicit dtypes: keys stay text (D/RE/PP numbers), low-cardinality columns
+# are categorical instead of millions of repeated strings. pandas' default NA
+# handling is kept, so NA/N/A/null/NaN cells are written empty as before.
+# wipo_field_ids is read as text and then typed as an inferring read would
+# (_as_inferred), so single-ID columns with blanks are still written as e.g.
+# 12.0. claim_sequence is a nullable integer: a blank cell stays blank.
+BIB_DTYPES = {
+    'patent_number': str,
+    'cpc_sections': 'category',
+    'ipc_sections': 'category',
+    'assignee': str,
+    'wipo_field_ids': str,
+    'first_wipo_field_title': 'category',
+    'first_wipo_sector_title': 'category',
+}
+CLAIMS_DTYPES = {
+    'patent_id': str,
+    'claim_sequence': 'Int32',
+    'claim_text': str,
+}
+
+# CSV engine for whole-file reads. pyarrow parses with several threads but
+# holds an Arrow copy of the file while converting, so it is opt-in.
+CSV_ENGINES = ('c', 'pyarrow') if pyarrow is not None else ('c',)
+CSV_ENGINE = 'c'
 
 # Select and reorder the required columns
 output_columns = [
-    'patent_id', 
+    'patent_id',
     'claim_sequence',
     'claim_text',
     'cpc_sections',
@@ -28,17 +111,362 @@ output_columns = [
     'first_wipo_sector_title'
 ]
 
-# Create output DataFrame with exact column order
-output_df = merged[['patent_number', 'cpc_sections', 'ipc_sections', 'assignee', 'wipo_field_ids', 
-                   'first_wipo_field_title', 'first_wipo_sector_title', 'claim_sequence', 'claim_text']]
+# Claims rows per chunk in --streaming mode (and per chunk with --inputs)
+CHUNK_ROWS = 200_000
+
+# --inputs: IDs to sample (Merger.c's default) and default output file
+SAMPLE_SIZE = 100_000
+MULTI_OUTPUT_FILE = 'merged.csv'
+CLAIMS_YEAR_RE = re.compile(r'claims_(\d{1,4})')
+DUPLICATES = ('last', 'first', 'join')
+BACKENDS = ('pandas', 'c')
+
+
+def _mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, or None where unavailable."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _as_inferred(values):
+    """Text `values` as read_csv would have typed them: numeric if every cell parses."""
+    try:
+        return pd.to_numeric(values)
+    except (ValueError, TypeError):
+        return values
+
+
+def read_bib(bib_file, engine=CSV_ENGINE, cache=None):
+    """The bibliographic columns the merge needs, typed as BIB_DTYPES."""
+    options = dict(usecols=BIB_COLUMNS, dtype=BIB_DTYPES, engine=engine)
+    df = cache.read_csv(bib_file, **options) if cache else pd.read_csv(bib_file, **options)
+    df['wipo_field_ids'] = _as_inferred(df['wipo_field_ids'])
+    return df[BIB_COLUMNS]
+
+
+def read_claims(claims_file, engine=CSV_ENGINE, chunk_rows=None, cache=None):
+    """The claims columns the merge needs (an iterator of chunks if chunk_rows is set)."""
+    options = dict(sep='\t', usecols=CLAIMS_COLUMNS, dtype=CLAIMS_DTYPES)
+    if chunk_rows:
+        # pyarrow cannot read in chunks
+        if cache:
+            return cache.iter_csv(claims_file, chunk_rows, **options)
+        return pd.read_csv(claims_file, chunksize=chunk_rows, **options)
+    if cache:
+        return cache.read_csv(claims_file, engine=engine, **options)
+    return pd.read_csv(claims_file, engine=engine, **options)
+
+
+def merge_in_memory(bib_file=BIB_FILE, claims_file=CLAIMS_FILE, output_file=OUTPUT_FILE,
+                    engine=CSV_ENGINE, cache=None):
+    # Read the first file
+    start = time.perf_counter()
+    df1 = read_bib(bib_file, engine, cache)
+    print(f"Read {bib_file}: {len(df1)} rows, {_mb(df1):.1f} MB "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    # Read the second file
+    start = time.perf_counter()
+    df2 = read_claims(claims_file, engine, cache=cache)
+    print(f"Read {claims_file}: {len(df2)} rows, {_mb(df2):.1f} MB "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    # Merge on patent identifiers
+    start = time.perf_counter()
+    merged = pd.merge(
+        df1,
+        df2,
+        left_on=BIB_KEY,
+        right_on=CLAIMS_KEY,
+        how='inner'
+    )
+
+    # Create output DataFrame with exact column order
+    output_df = merged[BIB_COLUMNS + CLAIMS_COLUMNS[1:]]
+
+    # Rename patent_number to patent_id
+    output_df = output_df.rename(columns={BIB_KEY: 'patent_id'})
+
+    # Reorder columns to match output requirements
+    output_df = output_df[output_columns]
+    print(f"Merged {len(output_df)} rows, {_mb(output_df):.1f} MB "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    # Save to new CSV
+    start = time.perf_counter()
+    output_df.to_csv(output_file, index=False)
+    print(f"Wrote {output_file} in {time.perf_counter() - start:.1f}s")
+    return len(output_df)
+
+
+def _probe(chunk, bib, bib_index):
+    """Inner-join one claims chunk against the indexed bibliographic rows."""
+    if bib_index.is_unique:
+        positions = bib_index.get_indexer(chunk[CLAIMS_KEY])
+        hit = positions >= 0
+        matched = bib.iloc[positions[hit]].reset_index(drop=True)
+        claims = chunk.loc[hit, CLAIMS_COLUMNS[1:]].reset_index(drop=True)
+        joined = pd.concat([matched, claims], axis=1)
+    else:
+        # Repeated patent numbers: one output row per bibliographic match
+        joined = chunk[CLAIMS_COLUMNS].merge(bib, left_on=CLAIMS_KEY, right_on=BIB_KEY,
+                                             how='inner')
+    return joined.rename(columns={BIB_KEY: 'patent_id'})[output_columns]
+
+
+def merge_streaming(bib_file=BIB_FILE, claims_file=CLAIMS_FILE, output_file=OUTPUT_FILE,
+                    chunk_rows=CHUNK_ROWS, cache=None):
+    """
+    Hash join with the bibliographic file as the build side and the claims
+    file streamed through it chunk by chunk.
+    """
+    bib = read_bib(bib_file, cache=cache)
+    bib_index = pd.Index(bib[BIB_KEY])
+
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f_out:
+        pd.DataFrame(columns=output_columns).to_csv(f_out, index=False)
+        for chunk in read_claims(claims_file, chunk_rows=chunk_rows, cache=cache):
+            joined = _probe(chunk, bib, bib_index)
+            joined.to_csv(f_out, header=False, index=False)
+            count += len(joined)
+            print(f"Matched {count} claim rows...", end='\r')
+    print()
+    return count
+
+
+class MergeInput:
+    """One --inputs file: delimiter, header, ID column and claims year (0 if not claims)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, newline='', encoding='utf-8') as f:
+            header = f.readline().rstrip('\r\n')
+        self.delim = '\t' if '\t' in header and ',' not in header else ','
+        self.columns = next(csv.reader([header], delimiter=self.delim)) if header else []
+        # Data columns are read under positional names ('0', '1', ...) so
+        # repeated or odd header names cannot clash
+        self.names = [str(i) for i in range(len(self.columns))]
+        self.id_col = detect_id_column(self.columns)
+        self.key = self.names[self.id_col] if self.names else '0'
+        self.year = claims_year(path)
+        self.stem = os.path.splitext(os.path.basename(path))[0]
+
+    @property
+    def is_claims(self):
+        return self.year > 0
+
+    def chunks(self, columns=None, chunk_rows=CHUNK_ROWS, cache=None):
+        """Rows as text, columns named by position, in chunks."""
+        options = dict(sep=self.delim, header=None, skiprows=1, names=self.names, dtype=str,
+                       keep_default_na=False, index_col=False)
+        if cache:
+            return cache.iter_csv(self.path, chunk_rows, columns=columns, **options)
+        return pd.read_csv(self.path, usecols=columns, chunksize=chunk_rows, **options)
+
+
+def detect_id_column(columns):
+    """Merger.c heuristics: application_number, then patent+number/id, then app+number, else 0."""
+    names = [c.lower() for c in columns]
+    for i, name in enumerate(names):
+        if 'application_number' in name:
+            return i
+    best = None
+    for i, name in enumerate(names):
+        if 'patent' in name and ('number' in name or 'id' in name):
+            return i
+        if best is None and 'app' in name and 'number' in name:
+            best = i
+    return best if best is not None else 0
+
+
+def claims_year(path):
+    """Year from a claims_<YYYY> file name, or 0."""
+    stem = os.path.splitext(os.path.basename(path))[0].lower()
+    m = CLAIMS_YEAR_RE.search(stem)
+    return int(m.group(1)) if m else 0
+
+
+def read_id_index(inp, chunk_rows=CHUNK_ROWS, cache=None):
+    """Unique IDs of one file, in file order."""
+    ids = [chunk[inp.key] for chunk in inp.chunks([inp.key], chunk_rows, cache)]
+    if not ids:
+        return pd.Index([], dtype=str)
+    return pd.Index(pd.concat(ids, ignore_index=True).unique())
+
+
+def eligible_ids(inputs, chunk_rows=CHUNK_ROWS, cache=None):
+    """IDs in every non-claims file and in at least one claims file (if any), in file order."""
+    key_sets = [read_id_index(inp, chunk_rows, cache) for inp in inputs]
+    base_sets = [k for k, inp in zip(key_sets, inputs) if not inp.is_claims]
+    claim_sets = [k for k, inp in zip(key_sets, inputs) if inp.is_claims]
+    claims_union = pd.Index(pd.concat([k.to_series() for k in claim_sets]).unique()) if claim_sets else None
+
+    if not base_sets:
+        return claims_union if claims_union is not None else pd.Index([], dtype=str)
+
+    # Smallest non-claims file drives the intersection
+    base = min(base_sets, key=len)
+    mask = np.ones(len(base), dtype=bool)
+    for other in base_sets:
+        if other is not base:
+            mask &= base.isin(other)
+    if claims_union is not None:
+        mask &= base.isin(claims_union)
+    return base[mask]
+
+
+def sample_ids(ids, n, seed=None):
+    """n IDs drawn uniformly without replacement, kept in their original order."""
+    if n >= len(ids):
+        return ids
+    rng = np.random.default_rng(seed)
+    return ids[np.sort(rng.choice(len(ids), size=n, replace=False))]
+
+
+def output_names(inputs):
+    """Merger.c header: non-ID columns, _YYYY for claims files, [stem] on clashes."""
+    first = inputs[0]
+    id_name = first.columns[first.id_col] if first.columns else 'patent_id'
+    used = {id_name}
+    names = []
+    for inp in inputs:
+        file_names = []
+        for i, col in enumerate(inp.columns):
+            if i == inp.id_col:
+                continue
+            name = f"{col}_{inp.year}" if inp.is_claims else col
+            if name in used:
+                name = f"{name}[{inp.stem}]"
+            used.add(name)
+            file_names.append(name)
+        names.append(file_names)
+    return id_name, names
+
+
+def collect_rows(inp, wanted, names, duplicates='last', chunk_rows=CHUNK_ROWS, cache=None):
+    """
+    The rows of one file whose ID is in `wanted`, one per ID, indexed by ID.
+    A repeated ID keeps its last row (as Merger.c does), its first row, or
+    with duplicates='join' every value joined with ' || ' (e.g. all claims).
+    """
+    value_cols = [name for name in inp.names if name != inp.key]
+    parts = [chunk[chunk[inp.key].isin(wanted)]
+             for chunk in inp.chunks(chunk_rows=chunk_rows, cache=cache)]
+    rows = pd.concat(parts) if parts else pd.DataFrame(columns=inp.names, dtype=str)
+    if duplicates == 'join':
+        rows = rows.groupby(inp.key, sort=False)[value_cols].agg(' || '.join)
+    else:
+        rows = rows.drop_duplicates(subset=inp.key, keep=duplicates).set_index(inp.key)
+    rows = rows[value_cols]
+    rows.columns = names
+    return rows
+
+
+def merge_many(paths, output_file=MULTI_OUTPUT_FILE, sample=SAMPLE_SIZE, seed=None,
+               duplicates='last', chunk_rows=CHUNK_ROWS, cache=None):
+    """
+    Merger.c workflow: eligibility from the ID sets, then a second streaming
+    pass that keeps only the sampled IDs. Returns (eligible, written).
+    """
+    inputs = [MergeInput(p) for p in paths]
+    for inp in inputs:
+        kind = f"claims {inp.year}" if inp.is_claims else "base"
+        print(f"{inp.path}: {kind}, delimiter {inp.delim!r}, ID column {inp.columns[inp.id_col]!r}"
+              if inp.columns else f"{inp.path}: empty")
+
+    start = time.perf_counter()
+    eligible = eligible_ids(inputs, chunk_rows, cache)
+    print(f"Eligible IDs: {len(eligible)} ({time.perf_counter() - start:.1f}s)")
+    chosen = sample_ids(eligible, sample, seed)
+
+    id_name, names = output_names(inputs)
+    start = time.perf_counter()
+    frames = [collect_rows(inp, chosen, file_names, duplicates, chunk_rows, cache).reindex(chosen)
+              for inp, file_names in zip(inputs, names)]
+    merged = pd.concat(frames, axis=1).fillna('')
+    merged.index.name = id_name
+    merged.to_csv(output_file)
+    print(f"Collected and wrote {len(merged)} rows in {time.perf_counter() - start:.1f}s")
+    return len(eligible), len(merged)
+
+
+def c_merger_binary():
+    """The compiled Merger.c, or None (reason printed) to use pandas instead."""
+    try:
+        binary = c_merger.build()
+    except c_merger.BuildError as e:
+        print(f"{e}\nFalling back to the pandas merger.")
+        return None
+    if binary is None:
+        print("No C compiler found; falling back to the pandas merger.")
+    return binary
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge bibliographic patent rows with PatentsView claims.")
+    ap.add_argument("--bib", default=BIB_FILE, help=f"Bibliographic CSV (default: {BIB_FILE}).")
+    ap.add_argument("--claims", default=CLAIMS_FILE, help=f"Claims TSV (default: {CLAIMS_FILE}).")
+    ap.add_argument("--out", help=f"Output CSV (default: {OUTPUT_FILE}, or {MULTI_OUTPUT_FILE} with --inputs).")
+    ap.add_argument("--streaming", action="store_true",
+                    help="Index the bibliographic file and stream the claims file in chunks.")
+    ap.add_argument("--engine", choices=CSV_ENGINES, default=CSV_ENGINE,
+                    help=f"CSV reader for whole-file reads (default: {CSV_ENGINE}).")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                    help=f"Rows per chunk with --streaming/--inputs (default: {CHUNK_ROWS}).")
+    multi = ap.add_argument_group("multi-file merge (Merger.c rules)")
+    multi.add_argument("--inputs", nargs="+", metavar="FILE",
+                       help="Merge these CSV/TSV files by patent ID instead of --bib/--claims.")
+    multi.add_argument("-n", "--sample", type=int, default=SAMPLE_SIZE,
+                       help=f"Number of eligible IDs to write (default: {SAMPLE_SIZE}).")
+    multi.add_argument("--seed", type=int, help="Random seed for the sample (default: random).")
+    multi.add_argument("--duplicates", choices=DUPLICATES, default="last",
+                       help="Rows repeating an ID within a file: keep the last (default, as "
+                            "Merger.c), the first, or join the values with ' || '.")
+    multi.add_argument("--backend", choices=BACKENDS, default="pandas",
+                       help="pandas (default), or the compiled Merger.c (built on first use; "
+                            "pandas is used if there is no C compiler).")
+    add_cache_arguments(ap)
+    args = ap.parse_args()
+    cache = cache_from_args(args)
+
+    if args.backend == 'c' and not args.inputs:
+        ap.error("--backend c needs --inputs")
+
+    start = time.perf_counter()
+    if args.inputs:
+        out = args.out or MULTI_OUTPUT_FILE
+        binary = c_merger_binary() if args.backend == 'c' else None
+        if binary:
+            if args.seed is not None or args.duplicates != 'last':
+                print("Note: --seed and --duplicates are ignored by the C backend.")
+            eligible, count = c_merger.merge_many(binary, args.inputs, out, args.sample)
+        else:
+            eligible, count = merge_many(args.inputs, out, sample=args.sample, seed=args.seed,
+                                         duplicates=args.duplicates, chunk_rows=args.chunk_rows,
+                                         cache=cache)
+        print(f"Merged {len(args.inputs)} files. Eligible IDs: {eligible}. "
+              f"Wrote {count} rows to {out} in {time.perf_counter() - start:.1f}s")
+        return
 
-# Rename patent_number to patent_id
-output_df = output_df.rename(columns={'patent_number': 'patent_id'})
+    args.out = args.out or OUTPUT_FILE
+    if args.streaming:
+        count = merge_streaming(args.bib, args.claims, args.out, chunk_rows=args.chunk_rows,
+                                cache=cache)
+    else:
+        count = merge_in_memory(args.bib, args.claims, args.out, engine=args.engine, cache=cache)
 
-# Reorder columns to match output requirements
-output_df = output_df[output_columns]
+    print(f"Successfully created '{args.out}' with {count} rows "
+          f"in {time.perf_counter() - start:.1f}s")
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"Peak memory: {peak:.0f} MB")
 
-# Save to new CSV
-output_df.to_csv('combined.csv', index=False)
 
-print(f"Successfully created 'combined.csv' with {len(output_df)} rows")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,11 @@ Pipeline:
 - OCR each table cell with Tesseract
 - fold multi-line logical rows
 - write one Excel workbook with one sheet per PDF
+
+Sharded runs (many machines / processes):
+- write a manifest that splits the PDF list into N deterministic shards
+- each worker OCRs one shard into per-PDF intermediate JSON files
+- a merge step assembles the workbook in manifest order
 """
 
 from pathlib import Path
@@ -21,6 +26,7 @@ import argparse
 import shutil
 import re
 import math
+import json
 
 import numpy as np
 import cv2
@@ -430,6 +436,154 @@ def write_many_sheets(pdf_to_pages, out_xlsx: Path) -> Path:
     return out_xlsx
 
 
+# ---------------------------------------------------------------------------
+# Sharded runs
+# ---------------------------------------------------------------------------
+
+MANIFEST_VERSION = 1
+
+
+def collect_pdfs(directory, pattern: str, inputs) -> list:
+    """Resolve --dir/--glob and --inputs into one ordered, de-duplicated list."""
+    pdfs = []
+    if directory:
+        pdfs += sorted(directory.glob(pattern))
+    if inputs:
+        pdfs += list(inputs)
+
+    # dedupe & keep order
+    seen = set()
+    ordered = []
+    for p in pdfs:
+        p = p.resolve()
+        if p not in seen:
+            seen.add(p)
+            ordered.append(p)
+    return ordered
+
+
+def write_manifest(pdfs, num_shards: int, manifest_path: Path) -> dict:
+    """
+    Split the PDF list into num_shards shards (round-robin over the sorted
+    list, so the assignment only depends on the inputs) and save it as JSON.
+    Paths are stored relative to the manifest's directory, so the manifest
+    and the PDFs can be moved or mounted elsewhere together.
+    """
+    if num_shards < 1:
+        raise ValueError("Number of shards must be >= 1.")
+    base = manifest_path.parent.resolve()
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "num_shards": num_shards,
+        "files": [
+            {"index": i, "shard": i % num_shards,
+             "path": Path(os.path.relpath(p, base)).as_posix()}
+            for i, p in enumerate(pdfs)
+        ],
+    }
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def load_manifest(manifest_path: Path) -> dict:
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise RuntimeError(f"Unsupported manifest version in {manifest_path}.")
+    return manifest
+
+
+def manifest_pdf(manifest_path: Path, entry: dict) -> Path:
+    """PDF of one manifest entry, resolved against the manifest's directory."""
+    return manifest_path.parent / entry["path"]
+
+
+def default_work_dir(manifest_path: Path) -> Path:
+    return manifest_path.parent / f"{manifest_path.stem}_parts"
+
+
+def part_path(work_dir: Path, entry: dict) -> Path:
+    """Intermediate result file for one manifest entry."""
+    return work_dir / f"{entry['index']:06d}.json"
+
+
+def save_pages(pdf_path: Path, pages, out_path: Path):
+    """
+    Store the per-page DataFrames of one PDF as JSON. Written to a temp file
+    and renamed, so a killed worker never leaves a half-written part behind.
+    """
+    payload = {
+        "pdf": str(pdf_path),
+        "pages": [
+            {"page": n, "columns": list(df.columns), "data": df.values.tolist()}
+            for n, df in pages
+        ],
+    }
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    tmp.write_text(json.dumps(payload), encoding="utf-8")
+    os.replace(tmp, out_path)
+
+
+def load_pages(path: Path):
+    """Inverse of save_pages: returns (pdf_path, [(page_number, df), ...])."""
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    pages = [
+        (pg["page"], pd.DataFrame(pg["data"], columns=pg["columns"]))
+        for pg in payload["pages"]
+    ]
+    return Path(payload["pdf"]), pages
+
+
+def run_shard(manifest_path: Path, shard: int, work_dir: Path, **ocr_kwargs) -> int:
+    """
+    OCR every PDF assigned to `shard` into work_dir. PDFs whose part file
+    already exists are skipped, so a failed worker can simply be rerun.
+    Returns the number of PDFs processed in this call.
+    """
+    manifest = load_manifest(manifest_path)
+    if not 0 <= shard < manifest["num_shards"]:
+        raise ValueError(
+            f"Shard {shard} out of range (manifest has {manifest['num_shards']})."
+        )
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    done = 0
+    for entry in manifest["files"]:
+        if entry["shard"] != shard:
+            continue
+        out_path = part_path(work_dir, entry)
+        pdf_path = manifest_pdf(manifest_path, entry)
+        if out_path.exists():
+            print(" ->", pdf_path.name, "already done, skipping")
+            continue
+        if not pdf_path.exists():
+            sys.exit(f"Missing: {pdf_path}")
+        pages = process_pdf(pdf_path, **ocr_kwargs)
+        save_pages(pdf_path, pages, out_path)
+        done += 1
+        print(" ->", pdf_path.name, "done")
+    return done
+
+
+def merge_shards(manifest_path: Path, work_dir: Path, out_xlsx: Path) -> Path:
+    """
+    Assemble the workbook from all part files in manifest order, so sheet
+    names (including unique_sheet_name suffixes) match a single-process run.
+    """
+    manifest = load_manifest(manifest_path)
+    missing = [
+        entry["path"] for entry in manifest["files"]
+        if not part_path(work_dir, entry).exists()
+    ]
+    if missing:
+        raise RuntimeError(
+            f"{len(missing)} PDF(s) have no results yet, e.g. {missing[0]}"
+        )
+
+    bundle = [load_pages(part_path(work_dir, entry)) for entry in manifest["files"]]
+    return write_many_sheets(bundle, out_xlsx)
+
+
 # ---------------------------------------------------------------------------
 # CLI
 # ---------------------------------------------------------------------------
@@ -442,8 +596,9 @@ def main():
                     help="Directory containing PDFs.")
     ap.add_argument("--glob", type=str, default="*.pdf",
                     help="Glob pattern inside --dir (default: *.pdf).")
-    ap.add_argument("--out", type=Path, required=True,
-                    help="Output .xlsx path.")
+    ap.add_argument("--out", type=Path,
+                    help="Output .xlsx path (required unless running a shard "
+                         "or writing a manifest).")
     ap.add_argument("--dpi", type=int, default=450,
                     help="Rendering DPI for PDF pages.")
     ap.add_argument("--min-line-frac", type=float, default=0.38,
@@ -452,24 +607,47 @@ def main():
                     help="Padding around detected cells for OCR.")
     ap.add_argument("--psm", type=int, default=6,
                     help="Tesseract PSM mode for OCR.")
+    ap.add_argument("--manifest", type=Path,
+                    help="Shard manifest (JSON). Used with --shards, --shard or --merge.")
+    ap.add_argument("--shards", type=int,
+                    help="Write a manifest splitting the PDFs into this many shards, then exit.")
+    ap.add_argument("--shard", type=int,
+                    help="OCR only this shard (0-based) of --manifest into --work-dir.")
+    ap.add_argument("--merge", action="store_true",
+                    help="Build --out from the shard results listed in --manifest.")
+    ap.add_argument("--work-dir", type=Path,
+                    help="Directory for per-PDF shard results "
+                         "(default: <manifest>_parts next to the manifest).")
     args = ap.parse_args()
 
-    set_tesseract_cmd()
+    modes = sum([args.shards is not None, args.shard is not None, args.merge])
+    if modes > 1:
+        ap.error("--shards, --shard and --merge are mutually exclusive.")
+    if modes and not args.manifest:
+        ap.error("--shards, --shard and --merge require --manifest.")
+    if args.shard is None and args.shards is None and not args.out:
+        ap.error("--out is required.")
+
+    ocr_kwargs = dict(
+        dpi=args.dpi,
+        min_line_frac=args.min_line_frac,
+        pad=args.pad,
+        psm=args.psm,
+    )
+    work_dir = args.work_dir or (args.manifest and default_work_dir(args.manifest))
 
-    pdfs = []
-    if args.dir:
-        pdfs += sorted(args.dir.glob(args.glob))
-    if args.inputs:
-        pdfs += list(args.inputs)
+    if args.merge:
+        out = merge_shards(args.manifest, work_dir, args.out)
+        print("Saved workbook:", out)
+        return
 
-    # dedupe & keep order
-    seen = set()
-    ordered = []
-    for p in pdfs:
-        p = p.resolve()
-        if p not in seen:
-            seen.add(p)
-            ordered.append(p)
+    if args.shard is not None:
+        set_tesseract_cmd()
+        n = run_shard(args.manifest, args.shard, work_dir, **ocr_kwargs)
+        print(f"Shard {args.shard}: processed {n} PDF(s) into {work_dir}")
+        return
+
+    ordered = collect_pdfs(args.dir, args.glob, args.inputs)
 
     if not ordered:
         sys.exit("No PDFs found.")
@@ -478,15 +656,17 @@ def main():
         if not p.exists():
             sys.exit(f"Missing: {p}")
 
+    if args.shards is not None:
+        manifest = write_manifest(ordered, args.shards, args.manifest)
+        print(f"Wrote manifest: {args.manifest} "
+              f"({len(manifest['files'])} PDFs in {args.shards} shards)")
+        return
+
+    set_tesseract_cmd()
+
     bundle = []
     for p in ordered:
-        pages = process_pdf(
-            p,
-            dpi=args.dpi,
-            min_line_frac=args.min_line_frac,
-            pad=args.pad,
-            psm=args.psm,
-        )
+        pages = process_pdf(p, **ocr_kwargs)
         bundle.append((p, pages))
         print(" ->", p.name, "done")
 
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import argparse, re, random
+import argparse, re, random, warnings
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -51,21 +51,49 @@ def read_all_sheets_with_names(xlsx_path: Path) -> pd.DataFrame:
         merged.loc[merged[c].isin(["nan","None","NaT"]), c] = ""
     return merged
 
-def coerce_datetime(series: pd.Series) -> pd.Series:
+TZ_SUFFIX_RE = r"\s+[A-Za-z]{1,4}$"
+
+def coerce_datetime(series: pd.Series, fmt: str = None) -> pd.Series:
     """
     Parse timestamps; drop a trailing bare TZ-ish token (e.g., 'SS', 'PST').
+    Each distinct string is parsed once (timestamps repeat a lot): with `fmt`
+    or the format inferred from the first value, then any leftovers one by
+    one ('mixed'), as a per-value pd.to_datetime would.
     """
-    def parse_one(s):
-        s = str(s).strip()
-        if not s or s.lower() in {"nan", "none"}:
-            return pd.NaT
-        s = re.sub(r"\s+[A-Za-z]{1,4}$", "", s)
-        return pd.to_datetime(s, errors="coerce")
-    return series.apply(parse_one)
+    s = series.astype(str).fillna("").str.strip()
+    codes, uniq = pd.factorize(s)
+    uniq = pd.Series(uniq, dtype=object)
+    blank = (uniq == "") | uniq.str.lower().isin(["nan", "none"])
+    text = uniq.str.replace(TZ_SUFFIX_RE, "", regex=True).where(~blank)
+
+    with warnings.catch_warnings():
+        # no inferable format -> element-wise parsing, which is what we want
+        warnings.simplefilter("ignore", UserWarning)
+        parsed = pd.to_datetime(text, errors="coerce", format=fmt)
+    retry = parsed.isna() & text.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(text[retry], errors="coerce", format="mixed")
+    out = parsed.to_numpy()[codes]
+    out[codes < 0] = np.datetime64("NaT")
+    return pd.Series(out, index=series.index)
 
 def coerce_numeric(series: pd.Series) -> pd.Series:
     return pd.to_numeric(series, errors="coerce")
 
+def parse_columns(real: pd.DataFrame, ts_format: str = None) -> pd.DataFrame:
+    """
+    Parse 'Time Stamp' and 'Hits' once per workbook into _dt/_hits; the
+    model builders use these instead of coercing the columns again.
+    """
+    return real.assign(_dt=coerce_datetime(real["Time Stamp"], ts_format),
+                       _hits=coerce_numeric(real["Hits"]))
+
+def timestamps(real: pd.DataFrame) -> pd.Series:
+    return real["_dt"] if "_dt" in real.columns else coerce_datetime(real["Time Stamp"])
+
+def hits_numeric(real: pd.DataFrame) -> pd.Series:
+    return real["_hits"] if "_hits" in real.columns else coerce_numeric(real["Hits"])
+
 def fit_lognormal_params_pos(x: np.ndarray):
     """
     Fit lognormal μ,σ for x>0. Returns (mu, sigma) in log-space or None.
@@ -77,17 +105,33 @@ def fit_lognormal_params_pos(x: np.ndarray):
     lx = np.log(x + 1e-9)
     return float(lx.mean()), float(lx.std() + 1e-9)
 
-def sample_session_size_model(real: pd.DataFrame):
-    sizes = real.groupby("sheet_name").size().values
+def session_frame(real: pd.DataFrame) -> pd.DataFrame:
+    """
+    One stable sort of all rows by sheet (in workbook order) and row_in_sheet,
+    with _sheet (sheet code), _dt, _hits and _gap: seconds since the previous
+    row of the same sheet, NaN on each sheet's first row.
+    """
+    sheet = pd.factorize(real["sheet_name"])[0]  # first-appearance order, like groupby(sort=False)
+    row = pd.to_numeric(real["row_in_sheet"], errors="coerce").to_numpy()  # read back as text
+    order = np.lexsort((row, sheet))
+    df = real.assign(_sheet=sheet, _dt=timestamps(real), _hits=hits_numeric(real)).iloc[order]
+    gap = df["_dt"].diff().dt.total_seconds().to_numpy(float, copy=True)
+    sheet = sheet[order]
+    gap[np.r_[True, sheet[1:] != sheet[:-1]]] = np.nan
+    return df.assign(_gap=gap).reset_index(drop=True)
+
+def sample_session_size_model(real: pd.DataFrame, sessions: pd.DataFrame = None):
+    sheets = sessions["_sheet"] if sessions is not None else pd.factorize(real["sheet_name"])[0]
+    sizes = np.bincount(sheets)
     if sizes.size == 0:
         return np.array([20]), np.array([1.0])
     vals, counts = np.unique(sizes, return_counts=True)
     p = counts / counts.sum()
     return vals, p
 
-def start_time_model(real: pd.DataFrame):
-    dt = coerce_datetime(real["Time Stamp"])
-    first_by_sheet = real.assign(_dt=dt).groupby("sheet_name")["_dt"].min().dropna()
+def start_time_model(real: pd.DataFrame, sessions: pd.DataFrame = None):
+    sessions = session_frame(real) if sessions is None else sessions
+    first_by_sheet = sessions.groupby("_sheet")["_dt"].min().dropna()
     if first_by_sheet.empty:
         dow_w = np.array([1,1,1,1,1,0.7,0.5], float); dow_w /= dow_w.sum()
         hour_w = np.ones(24, float); hour_w[0:7]*=0.4; hour_w[18:24]*=0.6; hour_w/=hour_w.sum()
@@ -98,64 +142,44 @@ def start_time_model(real: pd.DataFrame):
         hour_w = (np.bincount(hour, minlength=24).astype(float)+1e-3); hour_w/=hour_w.sum()
     return dow_w, hour_w
 
-def gaps_from_real(real: pd.DataFrame):
+def gaps_from_real(real: pd.DataFrame, sessions: pd.DataFrame = None):
     """
     Collect positive consecutive gaps (seconds) within each sheet.
     """
-    dt = coerce_datetime(real["Time Stamp"])
-    gaps = []
-
-    df = real.assign(_dt=dt)
-    for _, g in df.groupby("sheet_name", sort=False):
-        t = g.sort_values("row_in_sheet")["_dt"]
-        s = t.diff().dt.total_seconds()
-        s = s[s > 0]
-        if not s.empty:
-            gaps.append(s.values.astype(float))
-
-    if gaps:
-        return np.concatenate(gaps)
+    sessions = session_frame(real) if sessions is None else sessions
+    gaps = sessions["_gap"].to_numpy()
+    gaps = gaps[gaps > 0]
+    if gaps.size:
+        return gaps.astype(float)
     return np.array([20.0, 30.0, 15.0], float)
 
-def align_hits_gaps(real: pd.DataFrame):
+def align_hits_gaps(real: pd.DataFrame, sessions: pd.DataFrame = None):
     """
     Build aligned arrays (hits_i, gap_i) where gap_i is the time (sec) between
     row i-1 and row i, aligned to row i's Hits, within each sheet.
     """
-    dt = coerce_datetime(real["Time Stamp"])
-    hits = coerce_numeric(real["Hits"])
-    out_h, out_g = [], []
-
-    df = real.assign(_dt=dt, _hits=hits)
-    for _, g in df.groupby("sheet_name", sort=False):
-        g = g.sort_values("row_in_sheet")
-        t = g["_dt"]
-        h = g["_hits"]
-
-        gaps_sec = t.diff().dt.total_seconds() # gap aligned to the current (later) row
-        mask = gaps_sec.notna() & (gaps_sec > 0) & h.notna()
-
-        if mask.any():
-            out_h.extend(h[mask].astype(float).to_list())
-            out_g.extend(gaps_sec[mask].astype(float).to_list())
-
-    if not out_h:
+    sessions = session_frame(real) if sessions is None else sessions
+    gaps_sec = sessions["_gap"].to_numpy()  # gap aligned to the current (later) row
+    h = sessions["_hits"].to_numpy(float)
+    mask = (gaps_sec > 0) & ~np.isnan(h)
+    if not mask.any():
         return np.array([]), np.array([])
-    return np.array(out_h, float), np.array(out_g, float)
+    return h[mask], gaps_sec[mask].astype(float)
 
 
-def build_joint_hits_time_model(real: pd.DataFrame):
+def build_joint_hits_time_model(real: pd.DataFrame, sessions: pd.DataFrame = None):
     """
     Fit lognormal marginals for Hits and gaps & a Gaussian-copula correlation (log-space).
     """
-    hits_all = coerce_numeric(real["Hits"]).dropna().to_numpy()
+    sessions = session_frame(real) if sessions is None else sessions
+    hits_all = sessions["_hits"].dropna().to_numpy()
     hits_all = hits_all[hits_all >= 0]
     mu_h, sg_h = fit_lognormal_params_pos(hits_all + 1.0) or (np.log(5.0), 1.0)
 
-    gaps_all = gaps_from_real(real)
+    gaps_all = gaps_from_real(real, sessions)
     mu_g, sg_g = fit_lognormal_params_pos(gaps_all) or (np.log(20.0), 0.7)
 
-    h_al, g_al = align_hits_gaps(real)
+    h_al, g_al = align_hits_gaps(real, sessions)
     if h_al.size >= 20:
         X = np.log(h_al + 1.0); Y = np.log(g_al + 1e-9)
         rho = float(np.corrcoef(X, Y)[0,1])
@@ -164,6 +188,16 @@ def build_joint_hits_time_model(real: pd.DataFrame):
         rho = 0.0
     return (mu_h, sg_h), (mu_g, sg_g), rho
 
+def fit_session_models(real: pd.DataFrame):
+    """
+    All generator models from one sorted pass over the workbook:
+    ((size_vals, size_p), (dow_w, hour_w), ((mu_h, sg_h), (mu_g, sg_g), rho)).
+    """
+    sessions = session_frame(real)
+    return (sample_session_size_model(real, sessions),
+            start_time_model(real, sessions),
+            build_joint_hits_time_model(real, sessions))
+
 def sample_correlated_lognormals(mu1, s1, mu2, s2, rho, n):
     cov = np.array([[1.0, rho],[rho, 1.0]], float)
     z = np.random.multivariate_normal([0,0], cov, size=n)
@@ -233,14 +267,13 @@ def perturb_query(q: str, p_digits=0.35, p_ws=0.4, p_bool=0.15) -> str:
 # --------------- main generator ---------------
 def synth_hits_time_sessions(xlsx_in: Path, out_path: Path, total_rows: int,
                              time_output: str, ts_format: str,
-                             risk_flag: str, query_flag: str, seed: int):
+                             risk_flag: str, query_flag: str, seed: int,
+                             in_ts_format: str = None):
     np.random.seed(seed); random.seed(seed)
-    real = read_all_sheets_with_names(xlsx_in)
+    real = parse_columns(read_all_sheets_with_names(xlsx_in), in_ts_format)
 
     # models
-    size_vals, size_p = sample_session_size_model(real)
-    dow_w, hour_w = start_time_model(real)
-    (mu_h, sg_h), (mu_g, sg_g), rho = build_joint_hits_time_model(real)
+    (size_vals, size_p), (dow_w, hour_w), ((mu_h, sg_h), (mu_g, sg_g), rho) = fit_session_models(real)
     query_pool = build_query_corpus(real)
 
     out_path.parent.mkdir(parents=True, exist_ok=True)
@@ -314,6 +347,9 @@ def main():
         default="%Y/%m/%d %I:%M %p",
         help="strftime for 'Time Stamp' (e.g., '%%m/%%d/%%Y %%I:%%M %%p')."
     )
+    ap.add_argument("--in-ts-format", default=None,
+                    help="strptime format of the workbook's 'Time Stamp' after the trailing token is "
+                         "dropped (default: inferred; values that do not match are parsed one by one).")
     ap.add_argument("--risk", choices=["on","off"], default="on",
                     help="Include risk_score/risk_label based only on Hits & time.")
     ap.add_argument("--query", choices=["on","off"], default="off",
@@ -329,7 +365,8 @@ def main():
         ts_format=args.ts_format,
         risk_flag=args.risk,
         query_flag=args.query,
-        seed=args.seed
+        seed=args.seed,
+        in_ts_format=args.in_ts_format
     )
 
 if __name__ == "__main__":
@@ -1,36 +1,85 @@
-import xml.etree.ElementTree as ET
-import csv
-import sys
+import argparse
 import os
+from functools import partial
+
+from record_filter import add_filter_arguments, filter_from_args
+from row_writers import ROW_GROUP_SIZE, add_output_arguments, open_row_writer
+from run_stats import RunStats, add_stats_arguments
+from xml_records import (
+    add_parse_arguments, compile_xpaths, element_text, extract_records, find_first,
+    is_lxml_element,
+)
 
 # --- CONFIGURATION ---
 # Updated tags for Patent Applications
 START_TAG = '<us-patent-application'
 END_TAG = '</us-patent-application>'
 
+# Define the columns we want in our CSV
+HEADERS = ['patent_id', 'date', 'section', 'num_claims', 'title', 'abstract', 'claims_text']
+
+# Column types for --format parquet (see row_writers)
+COLUMN_TYPES = {
+    'patent_id': 'string',
+    'date': 'date',
+    'section': 'category',
+    'num_claims': 'int32',
+    'title': 'string',
+    'abstract': 'string',
+    'claims_text': 'string',
+}
+
+# Claim-level stream (--claims-out): one row per claim. claim_sequence is the
+# 0-based position in the document, as in PatentsView g_claims; dependent
+# lists the claim numbers this claim refers to ("1;3"), empty if independent.
+# claim_number is text: normally "12", but a num such as "1a" is kept as is.
+CLAIM_HEADERS = ['patent_id', 'claim_sequence', 'claim_number', 'dependent', 'claim_text']
+CLAIM_COLUMN_TYPES = {
+    'patent_id': 'string',
+    'claim_sequence': 'int32',
+    'claim_number': 'string',
+    'dependent': 'string',
+    'claim_text': 'string',
+}
+
+# Paths inside us-bibliographic-data-application, anchored to the DTD's
+# structure so neither backend scans the whole subtree for them.
+# With lxml these run as precompiled XPath.
+PATHS = {
+    'patent_id': "publication-reference/document-id/doc-number",
+    'date': "publication-reference/document-id/date",
+    'title': "invention-title",
+    'cpc_section': "classifications-cpc/main-cpc/classification-cpc/section",
+    'ipcr_section': "classifications-ipcr/classification-ipcr/section",
+}
+XPATHS = compile_xpaths(PATHS)
+
 def get_text_safe(element, path):
-    """Helper to get text from a specific path safely."""
-    found = element.find(path)
+    """Helper to get text from a specific path (or compiled XPath) safely."""
+    found = find_first(element, path)
     return found.text.strip() if found is not None and found.text else ""
 
-def extract_application_data(root):
+def extract_application_data(root, claims_text=True):
     """
     Extracts specific columns from the us-patent-application root.
+    With claims_text=False the joined claims are left empty (num_claims is
+    still filled), for runs that write the claim-level stream instead.
     """
     data = {}
+    paths = XPATHS if is_lxml_element(root) else PATHS
 
     # 1. Patent ID & Date
     # Path: us-bibliographic-data-application -> publication-reference
     biblio = root.find('us-bibliographic-data-application')
     if biblio is not None:
-        data['patent_id'] = get_text_safe(biblio, ".//publication-reference//doc-number")
-        data['date'] = get_text_safe(biblio, ".//publication-reference//date")
-        data['title'] = get_text_safe(biblio, ".//invention-title")
+        data['patent_id'] = get_text_safe(biblio, paths['patent_id'])
+        data['date'] = get_text_safe(biblio, paths['date'])
+        data['title'] = get_text_safe(biblio, paths['title'])
         
         # 2. Classifications (CPC first, fallback to IPCR)
-        cpc_sec = get_text_safe(biblio, ".//classifications-cpc/main-cpc//section")
+        cpc_sec = get_text_safe(biblio, paths['cpc_section'])
         if not cpc_sec:
-            cpc_sec = get_text_safe(biblio, ".//classifications-ipcr/classification-ipcr/section")
+            cpc_sec = get_text_safe(biblio, paths['ipcr_section'])
         
         data['section'] = cpc_sec
 
@@ -45,67 +94,130 @@ def extract_application_data(root):
     # 4. Claims
     claims_node = root.find('claims')
     if claims_node is not None:
-        claim_texts = []
-        for claim in claims_node.findall('claim'):
+        claims = claims_node.findall('claim')
+        if claims_text:
             # Join all text recursively inside the claim
-            text = "".join(claim.itertext())
-            claim_texts.append(text.strip())
-        
-        data['claims_text'] = " || ".join(claim_texts)
-        data['num_claims'] = len(claim_texts)
+            claim_texts = [element_text(claim).strip() for claim in claims]
+            data['claims_text'] = " || ".join(claim_texts)
+        else:
+            data['claims_text'] = ""
+        data['num_claims'] = len(claims)
     else:
         data['claims_text'] = ""
         data['num_claims'] = 0
 
     return data
 
-def parse_xml_to_csv(input_file, output_file):
+def _claim_number(value, sequence):
+    """
+    '00012' -> '12'; anything else that isn't empty (e.g. '1a') is kept as
+    is. A missing number falls back to the claim's 1-based position.
+    """
+    value = (value or "").strip()
+    if value.isdigit():
+        return str(int(value))
+    return value or str(sequence + 1)
+
+def extract_claims(root, patent_id):
+    """
+    One dict per <claim>: position, number, the claims it depends on
+    (resolved from <claim-ref idref="CLM-..."> to claim numbers) and its text.
+    """
+    claims_node = root.find('claims')
+    if claims_node is None:
+        return []
+
+    claims = claims_node.findall('claim')
+    numbers = [_claim_number(claim.get('num'), sequence) for sequence, claim in enumerate(claims)]
+    by_id = {claim.get('id'): number for claim, number in zip(claims, numbers)}
+
+    rows = []
+    for sequence, claim in enumerate(claims):
+        refs = []
+        for ref in claim.iter('claim-ref'):
+            idref = ref.get('idref', '')
+            number = by_id.get(idref) or idref
+            if number and number not in refs:
+                refs.append(number)
+        rows.append({
+            'patent_id': patent_id,
+            'claim_sequence': sequence,
+            'claim_number': numbers[sequence],
+            'dependent': ";".join(refs),
+            'claim_text': element_text(claim).strip(),
+        })
+    return rows
+
+def extract_application_and_claims(root, claims_text=True):
+    """(application row, claim rows) from one parse of the record."""
+    data = extract_application_data(root, claims_text=claims_text)
+    return data, extract_claims(root, data.get('patent_id', ''))
+
+def parse_xml_to_csv(input_file, output_file, workers=1, ordered=True, backend='auto',
+                     fmt='csv', row_group_size=ROW_GROUP_SIZE, compression='snappy',
+                     record_filter=None, claims_file=None, claims_text=True,
+                     stats_json=None):
     if not os.path.exists(input_file):
         print(f"Error: File {input_file} not found.")
         return
 
-    # Define the columns we want in our CSV
-    headers = ['patent_id', 'date', 'section', 'num_claims', 'title', 'abstract', 'claims_text']
-
     print(f"Processing: {input_file}")
-    print("Writing to CSV...")
+    print(f"Writing to {fmt.upper()}...")
 
-    with open(input_file, 'r', encoding='utf-8') as f_in, \
-         open(output_file, 'w', newline='', encoding='utf-8') as f_out:
-        
-        writer = csv.DictWriter(f_out, fieldnames=headers)
-        writer.writeheader()
+    writer = open_row_writer(output_file, HEADERS, fmt, COLUMN_TYPES,
+                             row_group_size=row_group_size, compression=compression)
+    claims_writer = None
+    if claims_file:
+        print(f"Writing claims to: {claims_file}")
+        claims_writer = open_row_writer(claims_file, CLAIM_HEADERS, fmt, CLAIM_COLUMN_TYPES,
+                                        row_group_size=row_group_size, compression=compression)
+        extract = partial(extract_application_and_claims, claims_text=claims_text)
+    else:
+        extract = partial(extract_application_data, claims_text=claims_text)
 
-        buffer = []
-        inside_record = False
+    stats = RunStats(input_file)
+    try:
         count = 0
 
-        for line in f_in:
-            if START_TAG in line:
-                inside_record = True
-                buffer = [line]
-            elif inside_record:
-                buffer.append(line)
-                if END_TAG in line:
-                    inside_record = False
-                    xml_string = "".join(buffer)
-                    
-                    try:
-                        root = ET.fromstring(xml_string)
-                        row_data = extract_application_data(root)
-                        writer.writerow(row_data)
-                        count += 1
-                        
-                        if count % 500 == 0:
-                            print(f"Parsed {count} applications...", end='\r')
-                            
-                    except ET.ParseError:
-                        pass 
-
-    print(f"\nSuccess! Extracted {count} applications to {output_file}")
+        rows = extract_records(input_file, START_TAG, END_TAG, extract,
+                               workers=workers, ordered=ordered, backend=backend,
+                               record_filter=record_filter, stats=stats)
+        for row_data in rows:
+            if claims_writer is not None:
+                row_data, claim_rows = row_data
+                for claim_row in claim_rows:
+                    claims_writer.writerow(claim_row)
+            writer.writerow(row_data)
+            count += 1
+    finally:
+        writer.close()
+        if claims_writer is not None:
+            claims_writer.close()
+
+    stats.finish(stats_json)
+    print(f"Success! Extracted {count} applications to {output_file}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract application data from concatenated USPTO application XML into CSV or Parquet.")
+    ap.add_argument("input_file", help="Concatenated USPTO XML (.xml, or .zip/.gz/.xz read without unpacking).")
+    ap.add_argument("output_file")
+    add_parse_arguments(ap)
+    ap.add_argument("--claims-out", metavar="FILE",
+                    help="Also write one row per claim (patent_id, claim_sequence, claim_number, "
+                         "dependent, claim_text) to FILE.")
+    ap.add_argument("--no-claims-text", action="store_true",
+                    help="Leave claims_text empty in the application rows (use with --claims-out).")
+    add_output_arguments(ap)
+    add_filter_arguments(ap)
+    add_stats_arguments(ap)
+    args = ap.parse_args()
+
+    parse_xml_to_csv(args.input_file, args.output_file,
+                     workers=args.workers, ordered=not args.unordered,
+                     backend=args.backend, fmt=args.format,
+                     row_group_size=args.row_group_size, compression=args.compression,
+                     record_filter=filter_from_args(args), claims_file=args.claims_out,
+                     claims_text=not args.no_claims_text, stats_json=args.stats_json)
 
 if __name__ == "__main__":
-    if len(sys.argv) == 3:
-        parse_xml_to_csv(sys.argv[1], sys.argv[2])
-    else:
-        print("Usage: python3 parse_applications.py <input.xml> <output.csv>")
\ No newline at end of file
+    main()
@@ -0,0 +1,256 @@
+"""
+Byte-offset index for random access to single patents in USPTO bulk XML.
+
+build: scan weekly files once and store patent_id -> (file, offset, length)
+       for every <us-patent-grant>/<us-patent-application> record in SQLite.
+get:   look the IDs up, seek into the memory-mapped files and parse only
+       those records.
+
+Usage:
+python3 patent_index.py build patents.idx ipg240102.xml ipg240109.xml
+python3 patent_index.py get patents.idx 11856210 11856211 --extract citations
+python3 patent_index.py get patents.idx --ids-file ids.txt --extract raw --out records.xml
+"""
+import argparse
+import csv
+import mmap
+import os
+import sqlite3
+import sys
+
+from extract_all import EXTRACTORS
+from record_filter import DOC_NUMBER_RE, id_key
+from xml_records import (
+    PARSE_ERRORS, add_parse_arguments, detect_record_tags, is_compressed, iter_record_spans,
+    parse_record, resolve_backend,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    start_tag TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    id_key TEXT NOT NULL,
+    patent_id TEXT NOT NULL,
+    file_id INTEGER NOT NULL REFERENCES files(file_id),
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (id_key, file_id, offset)
+) WITHOUT ROWID;
+"""
+
+# Rows per executemany() while building
+INSERT_BATCH = 10000
+
+
+class StaleIndexError(RuntimeError):
+    """An indexed file changed after it was indexed, so its offsets are invalid."""
+
+
+def connect(index_path):
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def index_file(conn, path):
+    """
+    Add one uncompressed XML file to the index. Returns the number of records
+    indexed, or None if the file was already indexed and has not changed.
+    """
+    path = os.path.abspath(path)
+    if is_compressed(path):
+        raise ValueError(f"{path}: offsets need an uncompressed file; unpack it first.")
+    st = os.stat(path)
+
+    row = conn.execute("SELECT file_id, size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+    if row and row[1] == st.st_size and row[2] == st.st_mtime:
+        return None
+    if row:
+        conn.execute("DELETE FROM records WHERE file_id = ?", (row[0],))
+        conn.execute("DELETE FROM files WHERE file_id = ?", (row[0],))
+
+    tags = detect_record_tags(path)
+    if tags is None:
+        raise ValueError(f"{path}: no <us-patent-grant> or <us-patent-application> records.")
+    file_id = conn.execute(
+        "INSERT INTO files (path, size, mtime, start_tag) VALUES (?, ?, ?, ?)",
+        (path, st.st_size, st.st_mtime, tags[0]),
+    ).lastrowid
+
+    count = 0
+    batch = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for offset, length in iter_record_spans(mm, tags[0], tags[1]):
+            m = DOC_NUMBER_RE.search(mm, offset, offset + length)
+            if m is None:
+                continue
+            patent_id = m.group(1).decode('utf-8', 'replace')
+            batch.append((id_key(patent_id), patent_id, file_id, offset, length))
+            count += 1
+            if len(batch) >= INSERT_BATCH:
+                conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+                print(f"Indexed {count} records...", end='\r')
+    if batch:
+        conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", batch)
+    return count
+
+
+def build_index(index_path, xml_files):
+    conn = connect(index_path)
+    try:
+        for path in xml_files:
+            print(f"Indexing: {path}")
+            try:
+                with conn:
+                    count = index_file(conn, path)
+            except ValueError as exc:
+                print(f"Error: {exc}")
+                continue
+            if count is None:
+                print(" -> unchanged, skipped")
+            else:
+                print(f"\n -> {count} records")
+    finally:
+        conn.close()
+
+
+def _check_unchanged(path, size, mtime):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise StaleIndexError(f"{path} was indexed but no longer exists; rebuild the index.") from None
+    if st.st_size != size or st.st_mtime != mtime:
+        raise StaleIndexError(f"{path} changed since it was indexed; run build again.")
+
+
+def lookup(index_path, patent_ids):
+    """
+    Return [(patent_id, path, offset, length, start_tag), ...] for the
+    requested IDs, in request order; a patent found in several files appears
+    once per file. Raises StaleIndexError if one of those files no longer
+    has the size and mtime it was indexed with.
+    """
+    conn = sqlite3.connect(index_path)
+    try:
+        found = []
+        checked = set()
+        for requested in patent_ids:
+            rows = conn.execute(
+                "SELECT r.patent_id, f.path, r.offset, r.length, f.start_tag, f.size, f.mtime "
+                "FROM records r JOIN files f USING (file_id) "
+                "WHERE r.id_key = ? ORDER BY r.file_id, r.offset",
+                (id_key(requested),),
+            ).fetchall()
+            for patent_id, path, offset, length, start_tag, size, mtime in rows:
+                if path not in checked:
+                    _check_unchanged(path, size, mtime)
+                    checked.add(path)
+                found.append((patent_id, path, offset, length, start_tag))
+        return found
+    finally:
+        conn.close()
+
+
+def fetch_records(index_path, patent_ids, start_tag=None):
+    """
+    Yield (patent_id, record bytes) for each indexed occurrence of the IDs.
+    With start_tag (e.g. '<us-patent-grant'), occurrences in files of the
+    other record type are skipped with a message.
+    """
+    maps = {}
+    try:
+        for patent_id, path, offset, length, file_tag in lookup(index_path, patent_ids):
+            if start_tag is not None and file_tag != start_tag:
+                print(f"Skipping {patent_id} in {os.path.basename(path)}: "
+                      f"{file_tag[1:]} record, not {start_tag[1:]}", file=sys.stderr)
+                continue
+            if path not in maps:
+                f = open(path, 'rb')
+                maps[path] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            yield patent_id, maps[path][1][offset:offset + length]
+    finally:
+        for f, mm in maps.values():
+            mm.close()
+            f.close()
+
+
+def _read_ids(args):
+    ids = list(args.ids)
+    if args.ids_file:
+        with open(args.ids_file, encoding='utf-8') as f:
+            ids += [line.strip() for line in f if line.strip()]
+    return ids
+
+
+def get_records(index_path, patent_ids, extract='raw', out=None, backend='auto'):
+    """Write the requested records as raw XML or as rows of a registered extractor."""
+    f_out = open(out, 'w', newline='', encoding='utf-8') if out else sys.stdout
+    try:
+        found = 0
+        if extract == 'raw':
+            for _, record in fetch_records(index_path, patent_ids):
+                f_out.write(record.decode('utf-8'))
+                f_out.write('\n')
+                found += 1
+        else:
+            function, headers, _, start_tag = EXTRACTORS[extract]
+            backend = resolve_backend(backend)
+            rows = []
+            for patent_id, record in fetch_records(index_path, patent_ids, start_tag):
+                try:
+                    rows.append(function(parse_record(record, backend)))
+                except PARSE_ERRORS:
+                    print(f"Skipping malformed record for {patent_id}", file=sys.stderr)
+            if headers is None:
+                headers = sorted({key for row in rows for key in row})
+            writer = csv.DictWriter(f_out, fieldnames=headers)
+            writer.writeheader()
+            writer.writerows(rows)
+            found = len(rows)
+    finally:
+        if out:
+            f_out.close()
+    print(f"Found {found} record(s) for {len(patent_ids)} requested ID(s).", file=sys.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Index USPTO bulk XML by patent ID for fast single-record lookups.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="Index (or re-index changed) XML files.")
+    b.add_argument("index", help="SQLite index file (created if missing).")
+    b.add_argument("xml_files", nargs="+", help="Uncompressed concatenated USPTO XML files.")
+
+    g = sub.add_parser("get", help="Fetch records by patent ID.")
+    g.add_argument("index")
+    g.add_argument("ids", nargs="*", help="Patent IDs (leading zeros optional).")
+    g.add_argument("--ids-file", help="File with one patent ID per line.")
+    g.add_argument("--extract", default="raw",
+                   choices=["raw", *EXTRACTORS],
+                   help="Output raw record XML (default) or rows from one of the extractors.")
+    g.add_argument("--out", help="Output file (default: stdout).")
+    add_parse_arguments(g, workers=False)
+    args = ap.parse_args()
+
+    if args.command == "build":
+        build_index(args.index, args.xml_files)
+    else:
+        ids = _read_ids(args)
+        if not ids:
+            ap.error("give patent IDs or --ids-file")
+        if not os.path.exists(args.index):
+            sys.exit(f"Error: index {args.index} not found.")
+        try:
+            get_records(args.index, ids, extract=args.extract, out=args.out, backend=args.backend)
+        except StaleIndexError as exc:
+            sys.exit(f"Error: {exc}")
+
+
+if __name__ == "__main__":
+    main()
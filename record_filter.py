@@ -0,0 +1,137 @@
+"""
+Byte-level record filters for the USPTO XML extractors.
+
+Filters on patent ID, publication date and CPC section are checked against
+the raw bytes of a record's bibliographic header, before the record is
+parsed, so records that don't match never get an element tree built.
+
+The fields are read the same way the extractors read them:
+- patent_id: first doc-number in publication-reference
+- date:      first date in publication-reference (YYYYMMDD)
+- section:   main-cpc section, falling back to the first classification-ipcr
+"""
+import re
+
+PUB_REF_RE = re.compile(rb'<publication-reference\b')
+PUB_REF_END_RE = re.compile(rb'</publication-reference>')
+DOC_NUMBER_TAG_RE = re.compile(rb'<doc-number>\s*([^<]*?)\s*</doc-number>')
+DATE_TAG_RE = re.compile(rb'<date>\s*([^<]*?)\s*</date>')
+MAIN_CPC_RE = re.compile(rb'<main-cpc>')
+MAIN_CPC_END_RE = re.compile(rb'</main-cpc>')
+IPCR_RE = re.compile(rb'<classification-ipcr>')
+IPCR_END_RE = re.compile(rb'</classification-ipcr>')
+SECTION_TAG_RE = re.compile(rb'<section>\s*([^<]*?)\s*</section>')
+
+# First doc-number inside publication-reference in one regex, for callers
+# that only need the ID (patent_index, ingest).
+DOC_NUMBER_RE = re.compile(
+    rb'<publication-reference\b.*?<doc-number>\s*([^<]*?)\s*</doc-number>', re.S)
+
+
+def id_key(patent_id):
+    """Comparison key for IDs: case-insensitive, leading zeros dropped ('07017193' == '7017193')."""
+    return patent_id.strip().upper().lstrip('0')
+
+
+def _element_span(record, open_re, close_re, pos=0):
+    """(start, end) of the first element matched by open_re/close_re, or None."""
+    m = open_re.search(record, pos)
+    if m is None:
+        return None
+    end = close_re.search(record, m.end())
+    if end is None:
+        return None
+    return m.end(), end.start()
+
+
+def _field(record, tag_re, span):
+    if span is None:
+        return None
+    m = tag_re.search(record, span[0], span[1])
+    return m.group(1).decode('utf-8', 'replace') if m else None
+
+
+def scan_publication(record):
+    """(patent_id, date) from the record bytes; either may be None."""
+    span = _element_span(record, PUB_REF_RE, PUB_REF_END_RE)
+    return _field(record, DOC_NUMBER_TAG_RE, span), _field(record, DATE_TAG_RE, span)
+
+
+def scan_section(record):
+    """CPC section of the record (main-cpc first, then IPCR), or None."""
+    section = _field(record, SECTION_TAG_RE,
+                     _element_span(record, MAIN_CPC_RE, MAIN_CPC_END_RE))
+    if not section:
+        section = _field(record, SECTION_TAG_RE,
+                         _element_span(record, IPCR_RE, IPCR_END_RE))
+    return section or None
+
+
+def _normalize_date(value):
+    """'2024-01-02' / '20240102' -> '20240102'."""
+    digits = value.replace('-', '').replace('/', '')
+    if len(digits) != 8 or not digits.isdigit():
+        raise ValueError(f"Bad date {value!r}; use YYYY-MM-DD or YYYYMMDD.")
+    return digits
+
+
+class RecordFilter:
+    """
+    Cheap pre-parse predicate. All given conditions must hold; a record whose
+    field can't be found in the header does not match a filter on that field.
+    Picklable, so it can travel to --workers processes.
+    """
+
+    def __init__(self, ids=None, date_from=None, date_to=None, sections=None):
+        self.ids = {id_key(i) for i in ids} if ids is not None else None
+        self.date_from = _normalize_date(date_from) if date_from else None
+        self.date_to = _normalize_date(date_to) if date_to else None
+        self.sections = {s.strip().upper() for s in sections} if sections is not None else None
+
+    def __bool__(self):
+        return bool(self.ids is not None or self.date_from or self.date_to
+                    or self.sections is not None)
+
+    def matches(self, record):
+        if self.ids is not None or self.date_from or self.date_to:
+            patent_id, date = scan_publication(record)
+            if self.ids is not None and (patent_id is None or id_key(patent_id) not in self.ids):
+                return False
+            if self.date_from and (not date or date < self.date_from):
+                return False
+            if self.date_to and (not date or date > self.date_to):
+                return False
+        if self.sections is not None:
+            section = scan_section(record)
+            if section is None or section.upper() not in self.sections:
+                return False
+        return True
+
+
+def read_ids(path):
+    """One patent ID per line; blank lines and # comments ignored."""
+    with open(path, encoding='utf-8') as f:
+        return [line.split('#', 1)[0].strip() for line in f
+                if line.split('#', 1)[0].strip()]
+
+
+def add_filter_arguments(ap):
+    ap.add_argument("--ids", metavar="FILE",
+                    help="Only records whose patent ID is listed in FILE (one per line).")
+    ap.add_argument("--date-from", metavar="DATE",
+                    help="Only records published on or after DATE (YYYY-MM-DD).")
+    ap.add_argument("--date-to", metavar="DATE",
+                    help="Only records published on or before DATE (YYYY-MM-DD).")
+    ap.add_argument("--section", action="append", metavar="LETTER",
+                    help="Only records in this CPC section (main CPC, else IPCR); repeatable.")
+
+
+def filter_from_args(args):
+    """RecordFilter built from add_filter_arguments options, or None if none were given."""
+    record_filter = RecordFilter(
+        ids=read_ids(args.ids) if args.ids else None,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        sections=args.section,
+    )
+    return record_filter if record_filter else None
@@ -0,0 +1,141 @@
+"""
+Row writers shared by the XML extractors.
+
+Rows are the dicts returned by extract_application_data / extract_citations.
+They go either to CSV (csv.DictWriter, as before) or to a typed Parquet file
+that is written one row group at a time, so memory stays bounded no matter
+how large the input is. pyarrow is only needed for Parquet output, and is
+only imported once a Parquet writer is opened so CSV runs don't pay for it.
+"""
+import csv
+import datetime
+
+# pyarrow / pyarrow.parquet, set by _import_pyarrow
+pa = pq = None
+
+FORMATS = ('csv', 'parquet')
+COMPRESSIONS = ('snappy', 'zstd', 'gzip', 'none')
+
+# Rows buffered per Parquet row group. claims_text can be large, so keep this
+# modest; raise it for narrow outputs such as citations.
+ROW_GROUP_SIZE = 5000
+
+
+class CsvRowWriter:
+    def __init__(self, output_file, headers):
+        self._f = open(output_file, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._f, fieldnames=headers)
+        self._writer.writeheader()
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._f.close()
+
+
+def _to_date(value):
+    """'20240102' -> date(2024, 1, 2); empty or malformed -> None."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def _to_int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _to_str(value):
+    return value if value != '' else None
+
+
+def _import_pyarrow():
+    global pa, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow).") from None
+    pa, pq = pyarrow, pyarrow.parquet
+
+
+# Column type names used by the extractor modules -> (arrow type, converter)
+def _arrow_types():
+    return {
+        'string': (pa.string(), _to_str),
+        'category': (pa.dictionary(pa.int32(), pa.string()), _to_str),
+        'int32': (pa.int32(), _to_int),
+        'int64': (pa.int64(), _to_int),
+        'date': (pa.date32(), _to_date),
+    }
+
+
+class ParquetRowWriter:
+    """
+    Buffers rows column-wise and writes a Parquet row group every
+    row_group_size rows. column_types maps each header to one of
+    'string', 'category' (dictionary-encoded), 'int32', 'int64' or 'date'
+    (USPTO YYYYMMDD strings).
+    """
+
+    def __init__(self, output_file, headers, column_types, row_group_size=ROW_GROUP_SIZE,
+                 compression='snappy'):
+        _import_pyarrow()
+        types = _arrow_types()
+        self.headers = list(headers)
+        self._types = [types[column_types.get(h, 'string')] for h in self.headers]
+        self.schema = pa.schema([(h, t) for h, (t, _) in zip(self.headers, self._types)])
+        self.row_group_size = max(1, row_group_size)
+        self._columns = [[] for _ in self.headers]
+        self._writer = pq.ParquetWriter(
+            output_file, self.schema,
+            compression=None if compression == 'none' else compression,
+        )
+
+    def writerow(self, row):
+        for values, header, (_, convert) in zip(self._columns, self.headers, self._types):
+            values.append(convert(row.get(header)))
+        if len(self._columns[0]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._columns[0]:
+            return
+        arrays = []
+        for values, (arrow_type, _) in zip(self._columns, self._types):
+            if pa.types.is_dictionary(arrow_type):
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, arrow_type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._columns = [[] for _ in self.headers]
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def open_row_writer(output_file, headers, fmt='csv', column_types=None,
+                    row_group_size=ROW_GROUP_SIZE, compression='snappy'):
+    """CsvRowWriter or ParquetRowWriter with a common writerow()/close() interface."""
+    if fmt == 'parquet':
+        return ParquetRowWriter(output_file, headers, column_types or {},
+                                row_group_size=row_group_size, compression=compression)
+    return CsvRowWriter(output_file, headers)
+
+
+def add_output_arguments(ap):
+    """--format/--row-group-size/--compression, shared by the extractor CLIs."""
+    ap.add_argument("--format", choices=FORMATS, default="csv",
+                    help="Output format (default: csv). parquet keeps numbers and dates typed.")
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE,
+                    help=f"Rows per Parquet row group (default: {ROW_GROUP_SIZE}).")
+    ap.add_argument("--compression", choices=COMPRESSIONS, default="snappy",
+                    help="Parquet compression codec (default: snappy).")
@@ -0,0 +1,128 @@
+"""
+Throughput / ETA reporting for the XML extractors.
+
+extract_records fills a RunStats while it runs:
+- bytes read (file position; compressed bytes for .zip/.gz/.xz) and
+  the ETA, based on the input file size
+- records extracted, malformed records skipped and records rejected by
+  the byte-level filters
+- seconds spent splitting records out of the file (including reading,
+  decompression and filtering), parsing XML, running the extractor and
+  writing rows (time the caller spends between rows)
+
+With --workers the split/parse/extract times are added up over all worker
+processes, so they can exceed the wall-clock time; write is always measured
+in the main process.
+
+A progress line is printed every REPORT_SECONDS, and --stats-json writes
+the final numbers to a JSON file.
+"""
+import json
+import os
+import time
+
+# Seconds between progress lines
+REPORT_SECONDS = 5.0
+
+PHASES = ('split', 'parse', 'extract', 'write')
+
+
+def new_counts():
+    """Counters a worker fills for its part of the file and sends back."""
+    counts = dict.fromkeys(('records', 'skipped', 'filtered'), 0)
+    counts.update(dict.fromkeys(PHASES, 0.0))
+    return counts
+
+
+def _fmt_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _fmt_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class RunStats:
+    def __init__(self, input_file, report_seconds=REPORT_SECONDS):
+        self.input_file = input_file
+        try:
+            self.total_bytes = os.path.getsize(input_file)
+        except OSError:
+            self.total_bytes = 0
+        self.bytes_done = 0
+        self.workers = 1
+        self.counts = new_counts()
+        self.report_seconds = report_seconds
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def add(self, counts, nbytes=0):
+        """Merge a worker's counters (and the bytes of the range it covered)."""
+        for key, value in counts.items():
+            self.counts[key] += value
+        self.bytes_done += nbytes
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def eta(self):
+        """Seconds left, extrapolated from the bytes read so far, or None."""
+        if not self.bytes_done or not self.total_bytes:
+            return None
+        remaining = max(0, self.total_bytes - self.bytes_done)
+        return self.elapsed() * remaining / self.bytes_done
+
+    def line(self):
+        elapsed = max(self.elapsed(), 1e-9)
+        pct = 100.0 * self.bytes_done / self.total_bytes if self.total_bytes else 0.0
+        eta = self.eta()
+        return (f"{pct:5.1f}% | {_fmt_bytes(self.bytes_done)} of {_fmt_bytes(self.total_bytes)}"
+                f" | {_fmt_bytes(self.bytes_done / elapsed)}/s"
+                f" | {self.counts['records'] / elapsed:,.0f} rec/s"
+                f" | {self.counts['records']:,} records, {self.counts['skipped']:,} malformed"
+                f" | ETA {_fmt_duration(eta) if eta is not None else '?'}")
+
+    def report(self, force=False):
+        """Print the progress line if REPORT_SECONDS have passed (or force)."""
+        now = time.perf_counter()
+        if not force and now - self._last_report < self.report_seconds:
+            return
+        self._last_report = now
+        print(self.line(), end='\r', flush=True)
+
+    def as_dict(self):
+        elapsed = self.elapsed()
+        return {
+            'input_file': self.input_file,
+            'input_bytes': self.total_bytes,
+            'bytes_read': self.bytes_done,
+            'elapsed_seconds': round(elapsed, 3),
+            'workers': self.workers,
+            'records': self.counts['records'],
+            'skipped_malformed': self.counts['skipped'],
+            'filtered_out': self.counts['filtered'],
+            'records_per_second': round(self.counts['records'] / elapsed, 1) if elapsed else None,
+            'bytes_per_second': round(self.bytes_done / elapsed) if elapsed else None,
+            'phase_seconds': {phase: round(self.counts[phase], 3) for phase in PHASES},
+        }
+
+    def finish(self, json_path=None):
+        """Final progress line; write the stats to json_path if given."""
+        self.bytes_done = max(self.bytes_done, self.total_bytes)
+        print(self.line())
+        phases = ", ".join(f"{p} {self.counts[p]:.1f}s" for p in PHASES)
+        print(f"Elapsed {_fmt_duration(self.elapsed())} ({phases})")
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(self.as_dict(), f, indent=2)
+                f.write('\n')
+            print(f"Stats written to {json_path}")
+
+
+def add_stats_arguments(ap):
+    ap.add_argument("--stats-json", metavar="FILE",
+                    help="Write throughput, skipped-record counts and phase timings to FILE as JSON.")
@@ -0,0 +1,187 @@
+"""
+Synthetic USPTO bulk XML for testing and benchmarking the extractors.
+
+Writes concatenated <us-patent-grant> or <us-patent-application> documents
+shaped like the weekly files: XML declaration and DOCTYPE per record,
+bibliographic data (publication/application references, IPCR and main CPC
+classifications, title, cited patents and non-patent literature for
+grants), abstract, description paragraphs and claims with claim-ref
+dependencies. A fraction of the records can be made malformed (undefined
+entity), like the occasional bad record in real files.
+
+The output is the same for the same options and --seed. .gz/.xz/.zip
+output names are compressed.
+
+Usage:
+python3 synth_xml.py grants.xml --kind grant --records 20000
+python3 synth_xml.py apps.xml.gz --kind application --records 5000 --claims 1-40 --malformed 0.01
+"""
+import argparse
+import gzip
+import lzma
+import os
+import random
+import zipfile
+
+KINDS = {
+    'grant': ('us-patent-grant', 'us-bibliographic-data-grant', 'B2', 'v4.7 2022-02-17'),
+    'application': ('us-patent-application', 'us-bibliographic-data-application', 'A1',
+                    'v4.6 2022-02-17'),
+}
+
+WORDS = ("apparatus method system device signal layer substrate circuit member "
+         "portion surface configured first second plurality coupled wherein each "
+         "control data unit module housing sensor assembly network memory processor "
+         "valve shaft electrode composition polymer terminal frame").split()
+
+SECTIONS = 'ABCDEFGH'
+
+
+def _parse_range(text):
+    """'5' -> (5, 5); '1-20' -> (1, 20)."""
+    low, _, high = text.partition('-')
+    low, high = int(low), int(high or low)
+    if low < 0 or high < low:
+        raise argparse.ArgumentTypeError(f"bad range {text!r}; use N or MIN-MAX")
+    return low, high
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(*words)))
+
+
+def _classification(rng):
+    return (f"<section>{rng.choice(SECTIONS)}</section><class>{rng.randint(1, 99):02d}</class>"
+            f"<subclass>{rng.choice('ABCDEFGHJKLMN')}</subclass>"
+            f"<main-group>{rng.randint(1, 99)}</main-group><subgroup>{rng.randint(0, 999):02d}</subgroup>")
+
+
+def synth_record(rng, index, kind='grant', claims=(1, 20), citations=(0, 30),
+                 npl_fraction=0.2, paragraphs=(5, 20), words=(20, 80), malformed=False):
+    """One complete document (declaration, DOCTYPE and root element) as a str."""
+    tag, bib, kind_code, dtd = KINDS[kind]
+    number = (10000000 if kind == 'grant' else 20240000000) + index
+    date = f"2024{index % 12 + 1:02d}{index % 28 + 1:02d}"
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<!DOCTYPE {tag} SYSTEM "{tag}-v47-2022-02-17.dtd" [ ]>\n',
+        f'<{tag} lang="EN" dtd-version="{dtd}" file="US{number}-{date}.XML" '
+        f'status="PRODUCTION" id="{tag}" country="US" date-produced="{date}" date-publ="{date}">\n',
+        f'<{bib}>\n',
+        f'<publication-reference><document-id><country>US</country><doc-number>{number:08d}</doc-number>'
+        f'<kind>{kind_code}</kind><date>{date}</date></document-id></publication-reference>\n',
+        f'<application-reference appl-type="utility"><document-id><country>US</country>'
+        f'<doc-number>{17000000 + index}</doc-number><date>20220315</date></document-id></application-reference>\n',
+        f'<classifications-ipcr><classification-ipcr><ipc-version-indicator><date>20060101</date>'
+        f'</ipc-version-indicator>{_classification(rng)}</classification-ipcr></classifications-ipcr>\n',
+        f'<classifications-cpc><main-cpc><classification-cpc>{_classification(rng)}'
+        f'</classification-cpc></main-cpc></classifications-cpc>\n',
+        f'<invention-title id="d2e53">{_text(rng, (3, 12)).capitalize()} &amp; related {rng.choice(WORDS)}</invention-title>\n',
+    ]
+
+    if kind == 'grant':
+        out.append('<us-references-cited>\n')
+        for c in range(rng.randint(*citations)):
+            if rng.random() < npl_fraction:
+                out.append(f'<us-citation><nplcit num="{c + 1:05d}"><othercit>{_text(rng, (5, 25))},\n'
+                           f' vol. {rng.randint(1, 99)}, pp. {rng.randint(1, 500)}.</othercit></nplcit>'
+                           '<category>cited by applicant</category></us-citation>\n')
+            else:
+                out.append(f'<us-citation><patcit num="{c + 1:05d}"><document-id><country>US</country>'
+                           f'<doc-number>{rng.randint(4000000, 11999999)}</doc-number><kind>B2</kind>'
+                           f'<name>{rng.choice(WORDS).capitalize()}</name><date>2015{rng.randint(1, 12):02d}01</date>'
+                           '</document-id></patcit><category>cited by examiner</category></us-citation>\n')
+        out.append('</us-references-cited>\n')
+    out.append(f'</{bib}>\n')
+
+    out.append(f'<abstract id="abstract"><p id="p-0001" num="0000">{_text(rng, (40, 150))}.</p></abstract>\n')
+    out.append('<description id="description">\n<?BRFSUM description="Brief Summary" end="lead"?>\n')
+    for p in range(rng.randint(*paragraphs)):
+        out.append(f'<p id="p-{p + 2:04d}" num="{p + 1:04d}">{_text(rng, words)}.</p>\n')
+    out.append('<?BRFSUM description="Brief Summary" end="tail"?>\n</description>\n')
+
+    if malformed:
+        out.append('<p>&undefined-entity;</p>\n')
+
+    out.append('<claims id="claims">\n')
+    for c in range(1, rng.randint(*claims) + 1):
+        ref = ''
+        if c > 1 and rng.random() < 0.7:
+            parent = rng.randint(1, c - 1)
+            ref = f' according to <claim-ref idref="CLM-{parent:05d}">claim {parent}</claim-ref>,'
+        out.append(f'<claim id="CLM-{c:05d}" num="{c:05d}"><claim-text>{c}. The {rng.choice(WORDS)}{ref} '
+                   f'comprising: <claim-text>{_text(rng, words)};</claim-text></claim-text></claim>\n')
+    out.append('</claims>\n')
+    out.append(f'</{tag}>\n')
+    return "".join(out)
+
+
+def _open_output(path):
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8')
+    if lower.endswith('.xz'):
+        return lzma.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def write_corpus(output_file, kind='grant', records=1000, claims=(1, 20), citations=(0, 30),
+                 npl_fraction=0.2, paragraphs=(5, 20), words=(20, 80), malformed=0.0, seed=0):
+    """Write `records` documents; returns the number that were made malformed."""
+    rng = random.Random(seed)
+    bad = 0
+
+    def documents():
+        nonlocal bad
+        for i in range(records):
+            is_bad = rng.random() < malformed
+            bad += is_bad
+            yield synth_record(rng, i, kind, claims, citations, npl_fraction,
+                               paragraphs, words, malformed=is_bad)
+
+    if output_file.lower().endswith('.zip'):
+        member = os.path.basename(output_file)[:-4] + '.xml'
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zf, zf.open(member, 'w') as f:
+            for doc in documents():
+                f.write(doc.encode('utf-8'))
+    else:
+        with _open_output(output_file) as f:
+            for doc in documents():
+                f.write(doc)
+    return bad
+
+
+def add_corpus_arguments(ap):
+    ap.add_argument("--records", type=int, default=1000, help="Number of documents (default: 1000).")
+    ap.add_argument("--claims", type=_parse_range, default=(1, 20), metavar="N|MIN-MAX",
+                    help="Claims per document (default: 1-20).")
+    ap.add_argument("--citations", type=_parse_range, default=(0, 30), metavar="N|MIN-MAX",
+                    help="Citations per grant (default: 0-30).")
+    ap.add_argument("--npl-fraction", type=float, default=0.2,
+                    help="Share of citations that are non-patent literature (default: 0.2).")
+    ap.add_argument("--paragraphs", type=_parse_range, default=(5, 20), metavar="N|MIN-MAX",
+                    help="Description paragraphs per document (default: 5-20).")
+    ap.add_argument("--words", type=_parse_range, default=(20, 80), metavar="N|MIN-MAX",
+                    help="Words per paragraph / claim (default: 20-80).")
+    ap.add_argument("--malformed", type=float, default=0.0,
+                    help="Fraction of malformed documents (default: 0).")
+    ap.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write synthetic concatenated USPTO grant/application XML.")
+    ap.add_argument("output_file", help="Output .xml (or .gz/.xz/.zip to compress).")
+    ap.add_argument("--kind", choices=KINDS, default="grant")
+    add_corpus_arguments(ap)
+    args = ap.parse_args()
+
+    bad = write_corpus(args.output_file, kind=args.kind, records=args.records, claims=args.claims,
+                       citations=args.citations, npl_fraction=args.npl_fraction,
+                       paragraphs=args.paragraphs, words=args.words,
+                       malformed=args.malformed, seed=args.seed)
+    size = os.path.getsize(args.output_file)
+    print(f"Wrote {args.records} {args.kind} records ({bad} malformed, {size / 1e6:.1f} MB) to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+"""
+Shared record splitter for the USPTO concatenated-XML bulk files.
+
+A weekly file is thousands of complete XML documents glued together, one per
+<us-patent-grant> / <us-patent-application>. Instead of reading text lines and
+joining them back together, the file is memory-mapped and scanned as bytes for
+the start/end tags; each record is handed to the XML parser as a memoryview
+slice of the map, so nothing is decoded or copied before parsing.
+
+For multi-core runs the file is cut into byte ranges that start on record
+boundaries and each range is parsed in its own worker process.
+
+Records are parsed with ElementTree by default; --backend lxml switches to a
+reusable lxml parser and the extractors to precompiled XPath.
+
+.zip/.gz/.xz bulk files are read without unpacking them to disk: a background
+thread decompresses into a small queue of chunks while the main thread splits
+and parses records out of them.
+
+extract_records can fill a run_stats.RunStats with throughput, skipped-record
+counts and per-phase timings as it goes.
+"""
+import gzip
+import lzma
+import mmap
+import os
+import queue
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import deque
+from multiprocessing import Pool
+
+from run_stats import RunStats, new_counts
+
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+GRANT_TAGS = ('<us-patent-grant', '</us-patent-grant>')
+APPLICATION_TAGS = ('<us-patent-application', '</us-patent-application>')
+
+# Bytes that may follow a start tag name (<us-patent-grant lang=... / <us-patent-grant>)
+_TAG_NAME_END = frozenset(b' \t\r\n>/')
+
+# Target size of one work unit in --workers mode; several per worker keeps
+# the pool busy and the progress counter moving.
+RANGE_BYTES = 32 * 1024 * 1024
+
+COMPRESSED_SUFFIXES = ('.zip', '.gz', '.xz')
+
+# Decompressed chunk size and how many chunks the reader thread may run ahead
+CHUNK_BYTES = 4 * 1024 * 1024
+CHUNK_QUEUE = 4
+
+# Records per work unit when compressed input is parsed with --workers
+BATCH_RECORDS = 256
+
+BACKENDS = ('auto', 'lxml', 'etree')
+
+# Raised for malformed records by either backend
+PARSE_ERRORS = (ET.ParseError,) + ((LET.XMLSyntaxError,) if LET is not None else ())
+
+# One lxml parser per process, created on first use
+_lxml_parser = None
+
+
+def _as_bytes(tag):
+    return tag.encode('ascii') if isinstance(tag, str) else tag
+
+
+def iter_record_spans(buf, start_tag, end_tag, begin=0, stop=None):
+    """
+    Yield (offset, length) for every record in buf whose start tag begins in
+    [begin, stop). buf is anything with bytes-style find/rfind (bytes, mmap).
+
+    Mirrors the old line-based splitter: a record runs from its start tag to
+    the end of its end tag, a start tag seen before the end tag restarts the
+    record, and an unterminated record at the end of the buffer is dropped.
+    """
+    start_tag = _as_bytes(start_tag)
+    end_tag = _as_bytes(end_tag)
+    size = len(buf)
+    if stop is None or stop > size:
+        stop = size
+    start_len = len(start_tag)
+
+    pos = begin
+    while pos < stop:
+        s = buf.find(start_tag, pos, min(size, stop + start_len - 1))
+        if s == -1:
+            return
+        after = s + start_len
+        if after < size and buf[after] not in _TAG_NAME_END:
+            # Longer tag name sharing the prefix, not a record boundary
+            pos = after
+            continue
+
+        e = buf.find(end_tag, after)
+        if e == -1:
+            return
+
+        # Truncated record: a newer start tag before this end tag wins
+        restart = buf.rfind(start_tag, after, e)
+        if restart != -1:
+            pos = restart
+            continue
+
+        end = e + len(end_tag)
+        yield s, end - s
+        pos = end
+
+
+def _open_map(f):
+    """Read-only map of an open file, or None for an empty file."""
+    if os.fstat(f.fileno()).st_size == 0:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def is_compressed(path):
+    return str(path).lower().endswith(COMPRESSED_SUFFIXES)
+
+
+def _read_chunks(f, raw, stats):
+    for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+        if stats is not None:
+            stats.bytes_done = raw.tell()
+        yield chunk
+
+
+def _iter_decompressed(path, stats=None):
+    """
+    Yield the decompressed bytes of path in CHUNK_BYTES pieces. stats.bytes_done
+    follows the position in the compressed file.
+    """
+    lower = str(path).lower()
+    with open(path, 'rb') as raw:
+        if lower.endswith('.zip'):
+            with zipfile.ZipFile(raw) as zf:
+                members = [m for m in zf.namelist() if not m.endswith('/')]
+                xml_members = [m for m in members if m.lower().endswith('.xml')]
+                for member in xml_members or members:
+                    with zf.open(member) as f:
+                        yield from _read_chunks(f, raw, stats)
+            return
+
+        f = gzip.GzipFile(fileobj=raw) if lower.endswith('.gz') else lzma.LZMAFile(raw)
+        with f:
+            yield from _read_chunks(f, raw, stats)
+
+
+def _threaded_chunks(chunks, depth=CHUNK_QUEUE):
+    """
+    Run the `chunks` generator in a background thread, at most `depth` chunks
+    ahead of the consumer. zlib/lzma release the GIL, so decompression
+    overlaps with splitting and parsing in the calling thread.
+    """
+    q = queue.Queue(maxsize=depth)
+    done = object()
+    stopping = threading.Event()
+
+    def put(item):
+        while not stopping.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(done)
+        except BaseException as exc:
+            put(exc)
+        finally:
+            chunks.close()
+
+    worker = threading.Thread(target=produce, name="xml-decompress", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopping.set()
+        worker.join()
+
+
+def _iter_stream_records(chunks, start_tag, end_tag):
+    """
+    Split records out of a stream of byte chunks. Each record is yielded as a
+    memoryview into an internal buffer, valid until the next one is requested.
+    """
+    start_tag = _as_bytes(start_tag)
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        consumed = 0
+        for offset, length in iter_record_spans(buf, start_tag, end_tag):
+            with memoryview(buf)[offset:offset + length] as record:
+                yield record
+            consumed = offset + length
+
+        # Keep only what may still become a record: from the next start tag
+        # on, or a tail that could hold the beginning of one.
+        keep = buf.find(start_tag, consumed)
+        if keep == -1:
+            keep = max(consumed, len(buf) - len(start_tag) + 1)
+        del buf[:keep]
+
+
+def iter_records(path, start_tag, end_tag, begin=0, stop=None, stats=None):
+    """
+    Yield every record in the file at path as a read-only memoryview.
+
+    The view points straight into the memory map (or, for .zip/.gz/.xz
+    input, into the decompression buffer) and is released as soon as the
+    next record is requested, so callers must parse (or bytes() it) before
+    moving on rather than keeping it around. begin/stop restrict the scan to
+    records starting in that byte range (see record_ranges); compressed
+    files can only be read from the start. If given, stats.bytes_done
+    tracks the read position.
+    """
+    if is_compressed(path):
+        if begin or stop is not None:
+            raise ValueError("Byte ranges are not supported for compressed input.")
+        yield from _iter_stream_records(
+            _threaded_chunks(_iter_decompressed(path, stats)), start_tag, end_tag)
+        return
+
+    with open(path, 'rb') as f:
+        mm = _open_map(f)
+        if mm is None:
+            return
+        with mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            try:
+                spans = iter_record_spans(mm, start_tag, end_tag, begin, stop)
+                for offset, length in spans:
+                    if stats is not None:
+                        stats.bytes_done = offset + length
+                    with view[offset:offset + length] as record:
+                        yield record
+            finally:
+                view.release()
+
+
+def detect_record_tags(path):
+    """
+    Return GRANT_TAGS or APPLICATION_TAGS depending on which record type
+    appears first near the start of the file, or None if neither does.
+    """
+    if is_compressed(path):
+        head = bytearray()
+        chunks = _iter_decompressed(path)
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= RANGE_BYTES:
+                break
+        chunks.close()
+    else:
+        with open(path, 'rb') as f:
+            head = f.read(RANGE_BYTES)
+
+    found = []
+    for tags in (GRANT_TAGS, APPLICATION_TAGS):
+        pos = head.find(_as_bytes(tags[0]))
+        if pos != -1:
+            found.append((pos, tags))
+    return min(found)[1] if found else None
+
+
+def record_ranges(path, start_tag, parts):
+    """
+    Cut the file into at most `parts` contiguous (begin, stop) byte ranges,
+    each starting exactly on a start tag, that together cover every record.
+    """
+    start_tag = _as_bytes(start_tag)
+    with open(path, 'rb') as f:
+        mm = _open_map(f)
+        if mm is None:
+            return []
+        with mm:
+            size = len(mm)
+            first = mm.find(start_tag)
+            if first == -1:
+                return []
+
+            cuts = [first]
+            for i in range(1, parts):
+                cut = mm.find(start_tag, max(cuts[-1] + 1, size * i // parts))
+                if cut == -1:
+                    break
+                if cut > cuts[-1]:
+                    cuts.append(cut)
+    cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def resolve_backend(backend='auto'):
+    """Map 'auto' to the default backend and check the requested one exists."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown XML backend {backend!r}; expected one of {BACKENDS}.")
+    if backend == 'auto':
+        # lxml parses faster but its per-element API calls are slower, and
+        # end to end it has not measured ahead of ElementTree on the
+        # extractors (see benchmark.py --backend), so it stays opt-in.
+        return 'etree'
+    if backend == 'lxml' and LET is None:
+        raise RuntimeError("The lxml backend needs lxml (pip install lxml).")
+    return backend
+
+
+def add_parse_arguments(ap, workers=True):
+    """
+    --backend, plus --workers/--unordered for tools that go through
+    extract_records (workers=False for the ones that parse record by record).
+    """
+    if workers:
+        ap.add_argument("--workers", type=int, default=1,
+                        help="Parse records in this many processes (default: 1).")
+        ap.add_argument("--unordered", action="store_true",
+                        help="With --workers, write rows as chunks finish instead of in file order.")
+    ap.add_argument("--backend", choices=BACKENDS, default="auto",
+                    help="XML parser: ElementTree (auto, the default) or lxml.")
+
+
+def is_lxml_element(element):
+    return LET is not None and isinstance(element, LET._Element)
+
+
+def compile_xpaths(paths):
+    """
+    Precompile ElementTree-style paths ({name: 'a/b'}) into lxml XPath
+    callables that return the first match, like Element.find. Returns {} when
+    lxml is not installed.
+
+    XPath evaluates the whole node set before taking the first match, so
+    descendant paths ('.//a') walk the entire subtree; paths anchored from
+    the element (child steps only) cost about as much as Element.find does
+    on ElementTree.
+    """
+    if LET is None:
+        return {}
+    return {name: LET.XPath(f'({path})[1]') for name, path in paths.items()}
+
+
+def find_first(element, path):
+    """Element.find for an ElementTree path or a compiled XPath from compile_xpaths."""
+    if callable(path):
+        found = path(element)
+        return found[0] if found else None
+    return element.find(path)
+
+
+def element_text(element):
+    """All text inside element (without its tail), like "".join(element.itertext())."""
+    if is_lxml_element(element):
+        # One call into libxml2 instead of a Python-level itertext loop
+        return LET.tostring(element, method='text', encoding='unicode', with_tail=False)
+    return "".join(element.itertext())
+
+
+def parse_record(record, backend='etree'):
+    """
+    Parse one record with the given (resolved) backend; raises one of
+    PARSE_ERRORS for a malformed record.
+    """
+    global _lxml_parser
+    if backend == 'lxml':
+        if _lxml_parser is None:
+            # Comments/PIs are dropped and entities left alone so the tree
+            # matches what ElementTree builds for the same bytes.
+            _lxml_parser = LET.XMLParser(remove_comments=True, remove_pis=True,
+                                         resolve_entities=False, huge_tree=True)
+        return LET.fromstring(record, _lxml_parser)
+    return ET.fromstring(record)
+
+
+def _extract_each(records, extract, backend, record_filter, counts):
+    """
+    Yield extract(root) for each record, filling counts (see
+    run_stats.new_counts) with record tallies and per-phase timings.
+    """
+    clock = time.perf_counter
+    records = iter(records)
+    while True:
+        t0 = clock()
+        record = next(records, None)
+        if record is None:
+            counts['split'] += clock() - t0
+            return
+        if record_filter is not None and not record_filter.matches(record):
+            counts['filtered'] += 1
+            counts['split'] += clock() - t0
+            continue
+        t1 = clock()
+        counts['split'] += t1 - t0
+        try:
+            root = parse_record(record, backend)
+        except PARSE_ERRORS:
+            counts['skipped'] += 1
+            counts['parse'] += clock() - t1
+            continue
+        t2 = clock()
+        counts['parse'] += t2 - t1
+        row = extract(root)
+        counts['extract'] += clock() - t2
+        counts['records'] += 1
+        yield row
+
+
+def _emit(rows, stats):
+    """Yield rows to the caller, timing the caller's work as the write phase."""
+    clock = time.perf_counter
+    counts = stats.counts
+    for row in rows:
+        t = clock()
+        yield row
+        counts['write'] += clock() - t
+        stats.report()
+
+
+def _extract_range(task):
+    """Worker: parse and extract every record in one byte range."""
+    path, start_tag, end_tag, begin, stop, extract, backend, record_filter = task
+    counts = new_counts()
+    rows = list(_extract_each(iter_records(path, start_tag, end_tag, begin, stop),
+                              extract, backend, record_filter, counts))
+    return rows, counts, stop - begin
+
+
+def _extract_batch(task):
+    """Worker: parse and extract a batch of record bytes (compressed input)."""
+    records, extract, backend = task
+    counts = new_counts()
+    rows = list(_extract_each(records, extract, backend, None, counts))
+    return rows, counts
+
+
+def _bounded_results(pool, func, tasks, window, ordered):
+    """
+    func(task) for each task, run in the pool with at most `window` tasks in
+    flight, so finished results never pile up ahead of a slow consumer.
+    Results come in task order unless ordered=False (then whichever pending
+    task is done first, if any is).
+    """
+    pending = deque()
+
+    def next_result():
+        res = None
+        if not ordered:
+            for candidate in pending:
+                if candidate.ready():
+                    res = candidate
+                    pending.remove(res)
+                    break
+        if res is None:
+            res = pending.popleft()
+        return res.get()
+
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        while len(pending) >= window:
+            yield next_result()
+    while pending:
+        yield next_result()
+
+
+def _record_batches(path, start_tag, end_tag, record_filter, stats):
+    """Lists of BATCH_RECORDS record bytes, split here (compressed input)."""
+    clock = time.perf_counter
+    batch = []
+    t0 = clock()
+    for record in iter_records(path, start_tag, end_tag, stats=stats):
+        if record_filter is not None and not record_filter.matches(record):
+            stats.counts['filtered'] += 1
+            continue
+        batch.append(bytes(record))
+        if len(batch) >= BATCH_RECORDS:
+            stats.counts['split'] += clock() - t0
+            yield batch
+            batch = []
+            t0 = clock()
+    stats.counts['split'] += clock() - t0
+    if batch:
+        yield batch
+
+
+def extract_records(path, start_tag, end_tag, extract, workers=1, ordered=True,
+                    backend='auto', record_filter=None, stats=None):
+    """
+    Yield extract(root) for every well-formed record in the file; malformed
+    records are skipped, and so are records rejected by record_filter (a
+    record_filter.RecordFilter, checked on the raw bytes before parsing).
+
+    With workers > 1 the file is split by record_ranges and the ranges are
+    parsed in a process pool (compressed files are split in this process and
+    parsed in batches instead), with at most two ranges or batches per worker
+    in flight so memory does not grow with the file. Rows come back in file order unless
+    ordered=False, in which case each chunk is yielded as soon as it is done.
+    `extract` must be a module-level function so it can be sent to workers.
+
+    Progress, skipped-record counts and phase timings go to `stats` (a
+    run_stats.RunStats), which also prints the periodic progress line.
+    """
+    backend = resolve_backend(backend)
+    if stats is None:
+        stats = RunStats(path, report_seconds=float('inf'))
+    stats.workers = max(1, workers)
+    if workers <= 1:
+        yield from _emit(_extract_each(iter_records(path, start_tag, end_tag, stats=stats),
+                                       extract, backend, record_filter, stats.counts), stats)
+        return
+
+    # A slow writer holds back the pool instead of finished rows piling up here
+    window = workers * 2
+    if is_compressed(path):
+        batches = _record_batches(path, start_tag, end_tag, record_filter, stats)
+        tasks = ((batch, extract, backend) for batch in batches)
+        with Pool(workers) as pool:
+            for rows, counts in _bounded_results(pool, _extract_batch, tasks, window, ordered):
+                stats.add(counts)
+                yield from _emit(rows, stats)
+        return
+
+    parts = max(workers * 4, os.path.getsize(path) // RANGE_BYTES)
+    tasks = [
+        (path, start_tag, end_tag, begin, stop, extract, backend, record_filter)
+        for begin, stop in record_ranges(path, start_tag, parts)
+    ]
+    with Pool(workers) as pool:
+        for rows, counts, nbytes in _bounded_results(pool, _extract_range, tasks, window, ordered):
+            stats.add(counts, nbytes)
+            yield from _emit(rows, stats)